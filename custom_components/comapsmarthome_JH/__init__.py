@@ -1,17 +1,38 @@
 """ComapSmartHome custom component."""
 
-from asyncio import timeout
-from datetime import timedelta
+import asyncio
 import logging
 
+import httpx
+
 from homeassistant import config_entries, core
-from homeassistant.exceptions import ConfigEntryAuthFailed
-from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.exceptions import ConfigEntryAuthFailed, ConfigEntryNotReady
+from homeassistant.helpers.storage import Store
+from homeassistant.util.ssl import get_default_context
 
-from .comap_functions import setComapValues
+from .coordinator import (
+    ComapDataUpdateCoordinator,
+    ComapSnapshotStore,
+    STORAGE_VERSION,
+)
 
-from .comap import ComapClientException, ComapClient
-from .const import DOMAIN
+from .comap import (
+    ComapClientAuthException,
+    ComapClientException,
+    ComapClient,
+    HTTP2_AVAILABLE,
+    MAX_SHARED_CONCURRENT_REQUESTS,
+    POOL_LIMITS,
+)
+from .const import (
+    DATA_REQUEST_SEMAPHORE,
+    DOMAIN,
+    SERVICE_GET_API_METRICS,
+    SERVICE_PROFILE_REFRESH,
+    SERVICE_SET_AWAY,
+    SERVICE_SET_HOME,
+    SERVICE_SET_ZONES_INSTRUCTIONS,
+)
 
 from homeassistant.const import (
     CONF_USERNAME,
@@ -20,6 +41,8 @@ from homeassistant.const import (
 
 _LOGGER = logging.getLogger(__name__)
 
+PLATFORMS = ["sensor", "binary_sensor", "switch", "select", "climate"]
+
 
 async def async_setup_entry(
     hass: core.HomeAssistant, entry: config_entries.ConfigEntry
@@ -28,14 +51,85 @@ async def async_setup_entry(
     
     """Set up platform from a ConfigEntry."""
     hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry.data
 
+    # A single client (and therefore a single Cognito session) is shared by
+    # every platform of this config entry, all entries share the cap on
+    # requests in flight.
+    shared_semaphore = hass.data.setdefault(
+        DATA_REQUEST_SEMAPHORE, asyncio.Semaphore(MAX_SHARED_CONCURRENT_REQUESTS)
+    )
+    # The connection pool belongs to the entry and is closed with the
+    # client, Home Assistant would only close its own clients on shutdown.
+    # The SSL context is the one Home Assistant has already loaded.
+    client = ComapClient(
+        username=entry.data[CONF_USERNAME],
+        password=entry.data[CONF_PASSWORD],
+        session=httpx.AsyncClient(
+            verify=get_default_context(), http2=HTTP2_AVAILABLE, limits=POOL_LIMITS
+        ),
+        owns_session=True,
+        shared_semaphore=shared_semaphore,
+    )
+    try:
+        store = ComapSnapshotStore(hass, entry.entry_id)
+        cached = await store.async_load()
+
+        # Resume the previous Cognito session instead of sending the password.
+        token_store = Store(hass, STORAGE_VERSION, DOMAIN + ".auth." + entry.entry_id)
+        tokens = await token_store.async_load()
+        if tokens is not None:
+            client.restore_tokens(tokens)
+        client.token_listener = lambda tokens: token_store.async_delay_save(
+            lambda: tokens, 1
+        )
 
-    config = hass.data[DOMAIN][entry.entry_id]
-    client = ComapClient(username=config[CONF_USERNAME], password=config[CONF_PASSWORD])
+        # One coordinator per housing of the account, all sharing the client.
+        coordinators = {}
+        if cached is None:
+            try:
+                await client.async_setup()
+            except ComapClientAuthException as err:
+                raise ConfigEntryAuthFailed from err
+            except (ComapClientException, httpx.HTTPError) as err:
+                raise ConfigEntryNotReady(
+                    f"Error communicating with Comap API: {err}"
+                ) from err
+            for housing_id in client.housings:
+                coordinators[housing_id] = ComapDataUpdateCoordinator(
+                    hass, client, housing_id, entry.options, store
+                )
+            # The housings are refreshed concurrently, within the client's limits.
+            await asyncio.gather(
+                *(
+                    coordinator.async_config_entry_first_refresh()
+                    for coordinator in coordinators.values()
+                )
+            )
+        else:
+            # Build the entities from the last saved snapshots right away, the
+            # client logs in lazily and the fresh data is reconciled later on.
+            client.housings = [housing["housing_id"] for housing in cached]
+            client.housing = client.housings[0]
+            for housing in cached:
+                coordinator = ComapDataUpdateCoordinator(
+                    hass, client, housing["housing_id"], entry.options, store
+                )
+                coordinator.async_restore(housing)
+                coordinators[housing["housing_id"]] = coordinator
+    except BaseException:
+        # Stop the token renewal and release the connections before the
+        # setup is retried with a new client.
+        await client.close()
+        raise
+    store.coordinators = list(coordinators.values())
 
-    
-    await setComapValues(hass,client)
+    hass.data[DOMAIN][entry.entry_id] = {
+        "config": entry.data,
+        "client": client,
+        "coordinators": coordinators,
+    }
+
+    entry.async_on_unload(entry.add_update_listener(async_update_options))
 
     # Forward the setup to the sensor platform.
     await hass.config_entries.async_forward_entry_setups(
@@ -45,4 +139,72 @@ async def async_setup_entry(
         entry, ["binary_sensor", "switch", "select", "climate"]
     )
 
-    return True
\ No newline at end of file
+    if cached is not None:
+        entry.async_create_background_task(
+            hass,
+            _async_refresh_restored(hass, entry, client, coordinators, store),
+            "comapsmarthome initial refresh",
+        )
+
+    return True
+
+
+async def _async_refresh_restored(hass, entry, client, coordinators, store):
+    """Refresh an entry started from its cache, reload it if its housings changed."""
+    try:
+        housings = await client.async_get_housings()
+    except (ComapClientAuthException, ComapClientException, httpx.HTTPError) as err:
+        # The refresh of the coordinators reports the error.
+        _LOGGER.debug("Could not check the housings of the account: %s", err)
+    else:
+        if {housing.get("id") for housing in housings} != set(coordinators):
+            _LOGGER.info("The housings of %s changed, reloading", entry.title)
+            # The cache holds the former housings, the next setup starts cold.
+            await store.async_remove()
+            hass.config_entries.async_schedule_reload(entry.entry_id)
+            return
+    await asyncio.gather(
+        *(coordinator.async_refresh() for coordinator in coordinators.values())
+    )
+
+
+async def async_update_options(
+    hass: core.HomeAssistant, entry: config_entries.ConfigEntry
+) -> None:
+    """Apply new options without reloading the entry."""
+    for coordinator in hass.data[DOMAIN][entry.entry_id]["coordinators"].values():
+        coordinator.set_options(entry.options)
+
+
+async def async_remove_entry(
+    hass: core.HomeAssistant, entry: config_entries.ConfigEntry
+) -> None:
+    """Delete the cached snapshot and tokens of a removed entry."""
+    await ComapSnapshotStore(hass, entry.entry_id).async_remove()
+    await Store(
+        hass, STORAGE_VERSION, DOMAIN + ".auth." + entry.entry_id
+    ).async_remove()
+
+
+async def async_unload_entry(
+    hass: core.HomeAssistant, entry: config_entries.ConfigEntry
+) -> bool:
+    """Unload a config entry, stop its token renewal and close its pool."""
+    unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unload_ok:
+        entry_data = hass.data[DOMAIN].pop(entry.entry_id)
+        # No merged refresh may reach the client once it is closed.
+        for coordinator in entry_data["coordinators"].values():
+            await coordinator.async_shutdown()
+        await entry_data["client"].close()
+        if not hass.data[DOMAIN]:
+            # The services act on every entry, drop them with the last one.
+            for service in (
+                SERVICE_GET_API_METRICS,
+                SERVICE_PROFILE_REFRESH,
+                SERVICE_SET_AWAY,
+                SERVICE_SET_HOME,
+                SERVICE_SET_ZONES_INSTRUCTIONS,
+            ):
+                hass.services.async_remove(DOMAIN, service)
+    return unload_ok
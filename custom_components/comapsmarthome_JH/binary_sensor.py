@@ -1,18 +1,16 @@
 from datetime import datetime, timedelta, timezone
-import logging
 
 from homeassistant.components.binary_sensor import (
     BinarySensorDeviceClass,
     BinarySensorEntity,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
-from homeassistant.core import HomeAssistant, callback
+from homeassistant.core import HomeAssistant
 from homeassistant.helpers.device_registry import DeviceInfo
 
-from . import ComapClient
 from .const import DOMAIN
 from.comap_functions import get_zone_thermal_details
+from .entity import ComapEntity
 
 
 async def async_setup_entry(
@@ -20,43 +18,38 @@ async def async_setup_entry(
     config_entry: ConfigEntry,
     async_add_entities,
 ) -> None:
-    config = hass.data[DOMAIN][config_entry.entry_id]
-    client = ComapClient(username=config[CONF_USERNAME], password=config[CONF_PASSWORD])
-
-    global HOUSING_DATA
-    HOUSING_DATA = hass.data[DOMAIN]["housing"]
-
-    global _HASS
-    _HASS = hass
-
-    zones = hass.data[DOMAIN]["thermal_details"].get("zones")
+    entry_data = hass.data[DOMAIN][config_entry.entry_id]
+    client = entry_data["client"]
 
     entities = list()
-    for zone in zones:
-        if (
-            "last_presence_detected" in zone.keys()
-            and zone["last_presence_detected"] != None
-        ):
-            entities.append(
-                ComapPresenceSensor(
-                    zone_id=zone.get("id"), zone_name=zone.get("title"), client=client
+    for coordinator in entry_data["coordinators"].values():
+        zones = coordinator.data["zones_by_id"].values()
+        for zone in zones:
+            if zone.last_presence_detected is not None:
+                entities.append(
+                    ComapPresenceSensor(
+                        coordinator,
+                        zone_id=zone.id,
+                        zone_name=zone.title,
+                        client=client,
+                    )
                 )
-            )
     # entities: entities
     async_add_entities(entities)
 
 
-class ComapPresenceSensor(BinarySensorEntity):
-    def __init__(self, zone_id, zone_name, client):
-        super().__init__()
+class ComapPresenceSensor(ComapEntity, BinarySensorEntity):
+    def __init__(self, coordinator, zone_id, zone_name, client):
+        super().__init__(coordinator)
         self.client = client
         self.zone_id = zone_id
         self.zone_name = zone_name
         self._attr_device_class = BinarySensorDeviceClass.OCCUPANCY
         self._name = zone_name + " presence"
-        self._id = HOUSING_DATA.get("id") + "_" + zone_id + "_presence"
+        self._id = coordinator.housing_id + "_" + zone_id + "_presence"
         self._is_on = None
         self.attrs = dict()
+        self._update_from_data()
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -89,17 +82,21 @@ class ComapPresenceSensor(BinarySensorEntity):
     def extra_state_attributes(self) -> dict:
         return self.attrs
 
-    
-    async def async_update(self):
-        zone = get_zone_thermal_details(self.zone_id,_HASS.data[DOMAIN]["thermal_details"])
-        last_presence_detected = zone.get("last_presence_detected")
+    def _data_changed(self) -> bool:
+        # Occupancy expires with time, re-evaluate it while it is on.
+        return self._is_on or self.coordinator.zone_changed(self.zone_id)
+
+    def _update_from_data(self):
+        zone = get_zone_thermal_details(self.zone_id,self.coordinator.data)
+        if zone is None:
+            return
+        last_presence_detected = zone.last_presence_detected
         self._is_on = self.is_occupied(last_presence_detected)
         self.attrs.update(
             {
                 "last_presence_detected": last_presence_detected,
             }
         )
-        self.async_write_ha_state()
 
     @staticmethod
     def is_occupied(timestamp):
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from typing import Any
 
@@ -22,16 +23,32 @@ from homeassistant.const import (
     CONF_USERNAME,
     UnitOfTemperature,
 )
-from homeassistant.core import HomeAssistant, callback
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse
+from homeassistant.exceptions import ServiceValidationError
 from homeassistant.helpers import config_validation as cv, entity_platform
+from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry
 from homeassistant.helpers.device_registry import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from homeassistant.helpers.typing import ConfigType
-from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry
 
-from .comap import ComapClient
-from .const import ATTR_SCHEDULE_NAME, DOMAIN, SERVICE_SET_SCHEDULE, ASSIST_COMPATIBILITY
-from .comap_functions import refresh_main_entity
+from .comap import MAX_CONCURRENT_REQUESTS, ComapClient
+from .const import (
+    ASSIST_COMPATIBILITY,
+    ATTR_DURATION,
+    ATTR_INSTRUCTIONS,
+    ATTR_MAX_PARALLEL,
+    ATTR_SCHEDULE_NAME,
+    DEFAULT_MAX_PARALLEL,
+    DOMAIN,
+    SERVICE_SET_SCHEDULE,
+    SERVICE_SET_ZONES_INSTRUCTIONS,
+)
+from .comap_functions import (
+    get_temperature_instruction,
+    get_zone_temperature,
+    get_zone_thermal_details,
+)
+from .coordinator import ComapDataUpdateCoordinator, all_coordinators
+from .entity import ComapEntity
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -59,55 +76,119 @@ async def async_setup_entry(
     config_entry: ConfigEntry,
     async_add_entities,
 ):
-    global _HASS
-    _HASS = hass
-
-    config = hass.data[DOMAIN][config_entry.entry_id]
+    entry_data = hass.data[DOMAIN][config_entry.entry_id]
     #assist_compatibility = config_entry.data.get(ASSIST_COMPATIBILITY)
     assist_compatibility = False
-    await async_setup_platform(hass, config, async_add_entities, assist_compatibility)
+    for coordinator in entry_data["coordinators"].values():
+        await async_setup_platform(
+            hass,
+            entry_data["client"],
+            coordinator,
+            async_add_entities,
+            assist_compatibility,
+        )
+
+    # The service is shared by every entry, accept the schedules of all of
+    # them.
+    schedule_ids = [
+        schedule_id
+        for coordinator in all_coordinators(hass)
+        for schedule_id in coordinator.data["schedules_by_id"]
+    ]
+
+    platform = entity_platform.async_get_current_platform()
+    platform.async_register_entity_service(
+        SERVICE_SET_SCHEDULE,
+        {
+            vol.Required(ATTR_SCHEDULE_NAME): vol.In(schedule_ids)
+        },
+        "service_set_schedule",
+    )
+
+    if hass.services.has_service(DOMAIN, SERVICE_SET_ZONES_INSTRUCTIONS):
+        return
+
+    async def set_zones_instructions(call: ServiceCall):
+        """Set temporary instructions on many zones at once."""
+        entity_registry = async_get_entity_registry(hass)
+        instructions = {}
+        for target, instruction in call.data[ATTR_INSTRUCTIONS].items():
+            # Zones can be given by id or by their climate entity.
+            zone_id = target
+            if target.startswith("climate."):
+                entry = entity_registry.async_get(target)
+                zone_id = entry.unique_id if entry is not None else None
+            coordinator = next(
+                (
+                    coordinator
+                    for coordinator in all_coordinators(hass)
+                    if zone_id in coordinator.data["zones_by_id"]
+                ),
+                None,
+            )
+            if coordinator is None:
+                raise ServiceValidationError(f"Unknown Comap zone: {target}")
+            if instruction in PRESET_MODE_MAP.inverse:
+                instruction = PRESET_MODE_MAP.inverse[instruction]
+            elif isinstance(instruction, float):
+                instruction = get_temperature_instruction(
+                    zone_id, instruction, coordinator.data
+                )
+            instructions.setdefault(coordinator, {})[zone_id] = instruction
+        # Each housing is written and refreshed concurrently.
+        reports = await asyncio.gather(
+            *(
+                coordinator.async_set_zones_instructions(
+                    zone_instructions,
+                    call.data[ATTR_DURATION],
+                    call.data[ATTR_MAX_PARALLEL],
+                )
+                for coordinator, zone_instructions in instructions.items()
+            )
+        )
+        return {"zones": {k: v for report in reports for k, v in report.items()}}
+
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_SET_ZONES_INSTRUCTIONS,
+        set_zones_instructions,
+        schema=vol.Schema(
+            {
+                vol.Required(ATTR_INSTRUCTIONS): {
+                    cv.string: vol.Any(vol.Coerce(float), cv.string)
+                },
+                vol.Optional(ATTR_DURATION, default=120): cv.positive_int,
+                # More zones would only queue behind the requests in flight
+                # the client allows per account.
+                vol.Optional(ATTR_MAX_PARALLEL, default=DEFAULT_MAX_PARALLEL): vol.All(
+                    vol.Coerce(int), vol.Range(min=1, max=MAX_CONCURRENT_REQUESTS)
+                ),
+            }
+        ),
+        supports_response=SupportsResponse.OPTIONAL,
+    )
 
 
 async def async_setup_platform(
     hass: HomeAssistant,
-    config: ConfigType,
+    client: ComapClient,
+    coordinator: ComapDataUpdateCoordinator,
     async_add_entities: AddEntitiesCallback,
     assist_compatibility: bool
 ) -> None:
     """Set up the comapsmarthome platform."""
 
-    client = ComapClient(username=config[CONF_USERNAME], password=config[CONF_PASSWORD])
-
-    housing_details = hass.data[DOMAIN]["thermal_details"]
-    heating_system_state = housing_details.get("heating_system_state")
-
-    for zone in housing_details.get("zones"):
-        zone.update({"heating_system_state": heating_system_state})
-
     zones = [
-        ComapZoneThermostat(client, zone, assist_compatibility)
-        for zone in housing_details.get("zones")
+        ComapZoneThermostat(coordinator, client, zone, assist_compatibility)
+        for zone in coordinator.data["zones_by_id"].values()
     ]
 
-    async_add_entities(zones, update_before_add=True)
-
-    schedules = hass.data[DOMAIN]["schedules"]
-
-    platform = entity_platform.async_get_current_platform()
-    platform.async_register_entity_service(
-        SERVICE_SET_SCHEDULE,
-        {
-            vol.Required(ATTR_SCHEDULE_NAME): vol.In(
-                [schedule["id"] for schedule in schedules]
-            )
-        },
-        "service_set_schedule",
-    )
+    async_add_entities(zones)
 
     return True
 
 
-class ComapZoneThermostat(ClimateEntity):
+class ComapZoneThermostat(ComapEntity, ClimateEntity):
     _attr_target_temperature_step = 0.5
     _attr_temperature_unit = UnitOfTemperature.CELSIUS
     #_attr_hvac_modes = [HVACMode.HEAT, HVACMode.OFF, HVACMode.AUTO]
@@ -122,42 +203,39 @@ class ComapZoneThermostat(ClimateEntity):
     _attr_hvac_mode: HVACMode | None
     _attr_hvac_action: HVACAction | None
 
-    def __init__(self, client, zone, assist_compatibility):
-        self.hass = _HASS
-        super().__init__()
+    def __init__(self, coordinator, client, zone, assist_compatibility):
+        super().__init__(coordinator)
         self._assist_compatibility = assist_compatibility
         self._attr_hvac_modes = [HVACMode.OFF, HVACMode.HEAT]
         if not assist_compatibility:
             self._attr_hvac_modes.append(HVACMode.AUTO)
         self.client = client
-        self.zone_id = zone.get("id")
-        self.zone_name = _HASS.data[DOMAIN]["housing"].get("name") + " zone " + zone.get("title")
-        self._name = "Thermostat " + _HASS.data[DOMAIN]["housing"].get("name") + " zone " + zone.get("title")
+        self.zone_id = zone.id
+        housing_name = coordinator.data["housing_info"].name
+        self.zone_name = housing_name + " zone " + zone.title
+        self._name = "Thermostat " + housing_name + " zone " + zone.title
         self._available = True
-        self.set_point_type = zone.get("set_point_type")
+        self._unknown_instruction = None
+        self.set_point_type = zone.set_point_type
         if (self.set_point_type == "custom_temperature") | (
             self.set_point_type == "defined_temperature"
         ):
             self.zone_type = "thermostat"
             self._attr_supported_features = ClimateEntityFeature.TARGET_TEMPERATURE
-            self._current_temperature = zone.get("temperature")
-            self._current_humidity = zone.get("humidity")
+            self._current_temperature = zone.temperature
+            self._current_humidity = zone.humidity
             if self.set_point_type == "custom_temperature":
-                self._attr_target_temperature = zone.get("set_point").get("instruction")
+                self._attr_target_temperature = zone.instruction
             else:
-                self.update_target_temperature(zone.get("set_point").get("instruction"))
+                self.update_target_temperature(zone.instruction)
 
         if self.set_point_type == "pilot_wire":
             self.zone_type = "pilot_wire"
-            self._preset_mode = self.map_preset_mode(
-                zone.get("set_point").get("instruction")
-            )
+            self._preset_mode = self.map_preset_mode(zone.instruction)
             self._attr_supported_features = ClimateEntityFeature.PRESET_MODE
         self._enable_turn_on_off_backwards_compatibility = False
-        self._hvac_mode: HVACMode = self.map_hvac_mode(zone)
-        self._hvac_action: HVACAction = self.map_hvac_action(zone)
         self.attrs: dict[str, Any] = {}
-        self.added = False
+        self._update_from_data()
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -169,7 +247,8 @@ class ComapZoneThermostat(ClimateEntity):
             },
             name = self.zone_name,
             manufacturer = "comap",
-            serial_number = self.zone_id
+            serial_number = self.zone_id,
+            via_device = (DOMAIN, self.coordinator.housing_id),
         )
 
     @property
@@ -185,7 +264,7 @@ class ComapZoneThermostat(ClimateEntity):
     @property
     def available(self) -> bool:
         """Return True if entity is available."""
-        return self._available
+        return self._available and super().available
 
     @property
     def current_temperature(self) -> float:
@@ -211,19 +290,20 @@ class ComapZoneThermostat(ClimateEntity):
     def extra_state_attributes(self) -> dict[str, Any] | None:
         return self.attrs
 
-    async def async_added_to_hass(self) -> None:
-        self.added = True
-        return await super().async_added_to_hass()
-
     async def async_set_preset_mode(self, preset_mode: str) -> None:
-        await self.client.set_temporary_instruction(
-            self.zone_id, self.map_comap_mode(preset_mode)
+        await self.async_set_instruction(self.map_comap_mode(preset_mode))
+
+    async def async_set_instruction(self, instruction):
+        r = await self.client.set_temporary_instruction(
+            self.zone_id, instruction, housing=self.coordinator.housing_id
         )
-        await self.async_update()
+        await self.coordinator.async_apply_zone_response(self.zone_id, r)
 
     async def async_reset_temporary (self):
-        await self.client.remove_temporary_instruction(self.zone_id)
-        await self.async_update()
+        r = await self.client.remove_temporary_instruction(
+            self.zone_id, housing=self.coordinator.housing_id
+        )
+        await self.coordinator.async_apply_zone_response(self.zone_id, r)
 
     async def async_set_hvac_mode(self, hvac_mode: str) -> bool:
         """Set new hvac mode."""
@@ -235,56 +315,47 @@ class ComapZoneThermostat(ClimateEntity):
         elif (hvac_mode == HVACMode.HEAT) & (self.zone_type == "pilot_wire"):
             await self.async_set_preset_mode(PRESET_COMFORT)
         elif (hvac_mode == HVACMode.OFF) & (self.zone_type == "thermostat"):
-            await self.client.set_temporary_instruction(self.zone_id, 7)
-            await self.async_update()
+            await self.async_set_instruction(7)
         elif (hvac_mode == HVACMode.HEAT) & (self.zone_type == "thermostat"):
-            await self.client.set_temporary_instruction(self.zone_id, 20)
-            await self.async_update()
-        await refresh_main_entity(_HASS)
+            await self.async_set_instruction(20)
 
     async def async_set_temperature(self, **kwargs) -> None:
-        await self.client.set_temporary_instruction(self.zone_id, kwargs["temperature"])
-        await self.async_update()
-        await refresh_main_entity(_HASS)
-
-    async def async_update(self):
-        zone_data = None
-        thermal_details = _HASS.data[DOMAIN]["thermal_details"]
-        zones = thermal_details.get("zones")
-        for zone in zones:
-            if zone.get("id") == self.zone_id:
-                zone_data = zone
-        if zone_data is None:
+        await self.async_set_instruction(
+            get_temperature_instruction(
+                self.zone_id, kwargs["temperature"], self.coordinator.data
+            )
+        )
+
+    def _data_changed(self) -> bool:
+        return self.coordinator.housing_changed or self.coordinator.zone_changed(
+            self.zone_id
+        )
+
+    def _update_from_data(self):
+        zone = get_zone_thermal_details(self.zone_id, self.coordinator.data)
+        if zone is None:
             _LOGGER.error("Error during refresh : no information found for " + self.name)
-            return
-        heating_system_state = thermal_details.get("heating_system_state")
-        zone_data.update({"heating_system_state": heating_system_state})
-        self.attributes_update(zone_data)
-        if self.added == True:
-            self.async_write_ha_state()
-
-    def attributes_update(self, zone_data):
-        self._current_temperature = zone_data.get("temperature")
-        self._current_humidity = zone_data.get("humidity")
-        self._hvac_mode = self.map_hvac_mode(zone_data)
-        self._hvac_action = self.map_hvac_action(zone_data)
-        self.set_point_type = zone_data.get("set_point_type")
+            return False
+        heating_system_state = self.coordinator.data["housing_info"].heating_system_state
+        self.attributes_update(zone, heating_system_state)
+        return True
+
+    def attributes_update(self, zone, heating_system_state):
+        self._current_temperature = zone.temperature
+        self._current_humidity = zone.humidity
+        self._hvac_mode = self.map_hvac_mode(zone, heating_system_state)
+        self._hvac_action = self.map_hvac_action(zone, heating_system_state)
+        self.set_point_type = zone.set_point_type
         if self.zone_type == "thermostat":
-            self.update_target_temperature(
-                zone_data.get("set_point").get("instruction")
-            )
+            self.update_target_temperature(zone.instruction)
         elif self.zone_type == "pilot_wire":
-            self._preset_mode = self.map_preset_mode(
-                zone_data.get("set_point").get("instruction")
-            )
-        next_timeslot = zone_data["next_timeslot"]
-        self.attrs["next_timeslot"] = next_timeslot["begin_at"]
-        self.attrs["next_instruction"] = next_timeslot["set_point"]["instruction"]
-
-    def map_hvac_mode(self, zone_data):
-        heating_system_state = zone_data.get("heating_system_state")
-        type = zone_data.get("set_point_type")
-        temporary_instruction = zone_data.get("events").get("temporary_instruction")
+            self._preset_mode = self.map_preset_mode(zone.instruction)
+        self.attrs["next_timeslot"] = zone.next_timeslot_begin_at
+        self.attrs["next_instruction"] = zone.next_instruction
+
+    def map_hvac_mode(self, zone, heating_system_state):
+        type = zone.set_point_type
+        temporary_instruction = zone.temporary_instruction
         if temporary_instruction is None:
             hvac_mode_map = {"off": HVACMode.OFF, "on": HVACMode.AUTO}
             if self._assist_compatibility is True:
@@ -299,9 +370,8 @@ class ComapZoneThermostat(ClimateEntity):
         else:
             return HVACMode.HEAT
         
-    def map_hvac_action(self, zone_data):
-        heating_status = zone_data.get("heating_status")
-        heating_system_state = zone_data.get("heating_system_state")
+    def map_hvac_action(self, zone, heating_system_state):
+        heating_status = zone.heating_status
         if heating_system_state == "off":
             return HVACAction.OFF
         hvac_action_map = {"cooling": HVACAction.IDLE, "heating": HVACAction.HEATING}
@@ -317,26 +387,23 @@ class ComapZoneThermostat(ClimateEntity):
         return PRESET_MODE_MAP.inverse[ha_mode]
 
     def update_target_temperature(self, instruction):
-        if self.set_point_type == "custom_temperature":
-            self._attr_target_temperature = instruction
-        elif self.set_point_type == "defined_temperature":
-            try:
-                temperatures = _HASS.data[DOMAIN]["temperatures"]
-                if instruction in temperatures:
-                    self._attr_target_temperature = temperatures[instruction]
-                elif instruction in temperatures["connected"]:
-                    self._attr_target_temperature = temperatures["connected"][
-                        instruction
-                    ]
-                elif instruction in temperatures["smart"]:
-                    self._attr_target_temperature = temperatures["smart"][instruction]
-                else:
-                    self._attr_target_temperature = 0
-            except:
-                self._attr_target_temperature = 0
+        if self.set_point_type not in ("custom_temperature", "defined_temperature"):
+            return
+        temperature = get_zone_temperature(
+            self.zone_id, self.set_point_type, instruction, self.coordinator.data
+        )
+        if temperature is None and instruction != self._unknown_instruction:
+            # Reported as unknown rather than as a 0 °C target.
+            _LOGGER.warning(
+                "No temperature known for instruction %s of %s", instruction, self.name
+            )
+        self._unknown_instruction = instruction if temperature is None else None
+        self._attr_target_temperature = temperature
 
     async def service_set_schedule(self, **kwargs: Any):
         """Set schedule by id for the zone"""
-        r = await self.client.set_schedule(self.zone_id, kwargs.get(ATTR_SCHEDULE_NAME))
-        await refresh_main_entity(_HASS)
+        r = await self.client.set_schedule(
+            self.zone_id, kwargs.get(ATTR_SCHEDULE_NAME), housing=self.coordinator.housing_id
+        )
+        await self.coordinator.async_refresh_endpoints("programs", "thermal_details")
         return r
\ No newline at end of file
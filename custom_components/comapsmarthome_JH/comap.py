@@ -1,23 +1,308 @@
+import asyncio
+from bisect import bisect_left
 import httpx
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from importlib.util import find_spec
 import logging
-from threading import Lock
+import random
+from time import monotonic
 
 _LOGGER = logging.getLogger(__name__)
-_TOKEN_LOCK = Lock()
+
+# HTTP/2 multiplexing is only available when the optional h2 package is installed.
+HTTP2_AVAILABLE = find_spec("h2") is not None
+POOL_LIMITS = httpx.Limits(
+    max_connections=10, max_keepalive_connections=5, keepalive_expiry=120
+)
+
+# Seconds before expiry at which a request will refresh the token itself.
+TOKEN_EXPIRY_MARGIN = 60
+# Seconds before expiry at which the token is renewed in the background, at
+# most this share of the token lifetime, and never sooner than the minimum
+# delay after the last renewal, however short-lived the tokens are.
+TOKEN_RENEW_AHEAD = 300
+TOKEN_RENEW_AHEAD_SHARE = 0.25
+TOKEN_RENEW_MIN_DELAY = 30
+# Seconds to wait before retrying a failed background renewal.
+TOKEN_RETRY_DELAY = 60
+# Maximum number of API requests in flight at once for one client.
+MAX_CONCURRENT_REQUESTS = 4
+# Maximum number of API requests in flight at once across every account of
+# a Home Assistant instance.
+MAX_SHARED_CONCURRENT_REQUESTS = 16
+# Token bucket shared by every request of one account: sustained requests
+# per second and burst size.
+RATE_LIMIT = 5
+RATE_LIMIT_BURST = 10
+# Retries of a throttled or failed request, and backoff bounds in seconds.
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1
+RETRY_MAX_DELAY = 60
+# Consecutive failed requests that open the circuit, and seconds it stays
+# open before a probe request is let through.
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 60
+# Upper bounds, in seconds, of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Path segments followed by an id, replaced in the endpoint names.
+_ID_SEGMENTS = {
+    "housings": "{housing}",
+    "zones": "{zone}",
+    "programs": "{program}",
+    "eligible-zones": "{serial}",
+}
+
+
+class TokenBucket(object):
+    """Asyncio token bucket limiting the request rate of one account."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a request may be sent, return the time waited."""
+        waited = 0
+        async with self._lock:
+            while True:
+                now = monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class CircuitBreaker(object):
+    """Fail fast while the Comap cloud keeps failing."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def before_request(self):
+        """Raise ComapClientUnavailable if the request must not be sent."""
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN:
+            if monotonic() - self._opened_at < self.reset_timeout:
+                raise ComapClientUnavailable("Comap API circuit is open")
+            self.state = self.HALF_OPEN
+        # Half open: only one probe at a time.
+        if self._probing:
+            raise ComapClientUnavailable("Comap API circuit is half open")
+        self._probing = True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            _LOGGER.info("Comap API reachable again, closing circuit")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_aborted(self):
+        """Forget a request that ended without an answer from the API."""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                _LOGGER.warning(
+                    "Comap API failing, opening circuit for %ss", self.reset_timeout
+                )
+            self.state = self.OPEN
+            self._opened_at = monotonic()
+
+
+class EndpointMetrics(object):
+    """Counters of the requests sent to one endpoint."""
+
+    __slots__ = (
+        "count",
+        "latency_sum",
+        "latency_max",
+        "buckets",
+        "statuses",
+        "retries",
+        "bytes",
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        # One bucket per LATENCY_BUCKETS bound plus one for slower requests.
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.statuses = {}
+        self.retries = 0
+        self.bytes = 0
+
+    def record(self, latency, status, size=0):
+        """Count one attempt, status is None if no response was received."""
+        self.count += 1
+        self.latency_sum += latency
+        if latency > self.latency_max:
+            self.latency_max = latency
+        self.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes += size
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "latency_mean": self.latency_sum / self.count if self.count else None,
+            "latency_max": self.latency_max,
+            "latency_buckets": dict(
+                zip([str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"], self.buckets)
+            ),
+            "statuses": {
+                "error" if status is None else str(status): count
+                for status, count in self.statuses.items()
+            },
+            "retries": self.retries,
+            "bytes": self.bytes,
+        }
+
+
+class RequestMetrics(object):
+    """Per endpoint metrics of the requests of one client.
+
+    Recording is a few integer updates, endpoint names are computed once
+    per URL.
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+        self.token_refreshes = 0
+        self.logins = 0
+        self._names = {}
+
+    def endpoint(self, mode, url, base_url):
+        """Return the metrics of the endpoint serving url."""
+        key = (mode, url)
+        name = self._names.get(key)
+        if name is None:
+            segments = url.removeprefix(base_url).split("/")
+            for index in range(1, len(segments)):
+                placeholder = _ID_SEGMENTS.get(segments[index - 1])
+                if placeholder is not None:
+                    segments[index] = placeholder
+            name = mode.upper() + " " + "/".join(segments)
+            self._names[key] = name
+        metrics = self.endpoints.get(name)
+        if metrics is None:
+            metrics = self.endpoints[name] = EndpointMetrics()
+        return metrics
+
+    def totals(self):
+        """Sum the counters of every endpoint."""
+        count = sum(metrics.count for metrics in self.endpoints.values())
+        latency_sum = sum(metrics.latency_sum for metrics in self.endpoints.values())
+        return {
+            "requests": count,
+            "errors": sum(
+                number
+                for metrics in self.endpoints.values()
+                for status, number in metrics.statuses.items()
+                if status is None or status >= 400
+            ),
+            "retries": sum(metrics.retries for metrics in self.endpoints.values()),
+            "bytes": sum(metrics.bytes for metrics in self.endpoints.values()),
+            "latency_mean": latency_sum / count if count else None,
+            "token_refreshes": self.token_refreshes,
+            "logins": self.logins,
+        }
+
+    def as_dict(self):
+        return {
+            "totals": self.totals(),
+            "endpoints": {
+                name: metrics.as_dict() for name, metrics in self.endpoints.items()
+            },
+        }
 
 
 class ComapClient(object):
     _BASEURL = "https://api.comapsmarthome.com/"
+    _AUTHURL = "https://cognito-idp.eu-west-3.amazonaws.com"
     login_headers = {}
     login_payload = {}
     token = ""
+    refresh_token = ""
     last_request = ""
     token_expires = ""
     clientid = ""
-
-    def __init__(self, username, password, clientid="56jcvrtejpracljtirq7qnob44"):
+    housing = None
+    housings = []
+
+    def __init__(
+        self,
+        username,
+        password,
+        clientid="56jcvrtejpracljtirq7qnob44",
+        session=None,
+        max_concurrent_requests=MAX_CONCURRENT_REQUESTS,
+        shared_semaphore=None,
+        base_url=None,
+        auth_url=None,
+        owns_session=None,
+        schedule_renewal=True,
+    ):
+        """Build a client without doing any I/O, see async_create.
+
+        shared_semaphore, when given, caps the requests in flight across all
+        the clients holding it on top of max_concurrent_requests. base_url
+        and auth_url point the client at another API and Cognito endpoint,
+        such as scripts/comap_standin.py.
+
+        close() only closes session if owns_session is True, by default
+        only the session the client creates itself. Short-lived clients,
+        such as the one checking credentials, pass schedule_renewal=False
+        so that no background token renewal is armed.
+        """
+        if base_url is not None:
+            self._BASEURL = base_url.rstrip("/") + "/"
+        if auth_url is not None:
+            self._AUTHURL = auth_url
         self.clientid = clientid
+        self._session = session
+        self._owns_session = session is None if owns_session is None else owns_session
+        self._schedule_renewals = schedule_renewal
+        self._request_semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._shared_semaphore = shared_semaphore
+        self._rate_limiter = TokenBucket(RATE_LIMIT, RATE_LIMIT_BURST)
+        self.circuit = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT)
+        self.stats = {
+            "throttled": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "last_retry_after": None,
+        }
+        self.metrics = RequestMetrics()
+        self._refresh_task = None
+        self._renew_handle = None
+        self._renewal_task = None
+        # Called with export_tokens() whenever the tokens change.
+        self.token_listener = None
         self.login_headers = {
             "Content-Type": "application/x-amz-json-1.1",
             "x-amz-target": "AWSCognitoIdentityProviderService.InitiateAuth",
@@ -32,18 +317,30 @@ class ComapClient(object):
             },
             "ClientId": clientid,
         }
+
+    @classmethod
+    async def async_create(cls, username, password, session=None, **kwargs):
+        """Create a client, log in and discover the housings."""
+        client = cls(username, password, session=session, **kwargs)
+        await client.async_setup()
+        return client
+
+    async def async_setup(self):
+        """Log in if needed and discover the housings of the account."""
         try:
-            self.login()
-            housings = self.get_housings()
-            self.housing = housings[0].get("id")
+            if not self.token_is_valid():
+                await self.token_refresh()
+            housings = await self.async_get_housings()
+            self.housings = [housing.get("id") for housing in housings]
+            # Default housing of the endpoints called without one.
+            self.housing = self.housings[0]
         except AttributeError as err:
             raise ComapClientAuthException from err
 
-    def login(self):
+    async def login(self):
         try:
-            url = "https://cognito-idp.eu-west-3.amazonaws.com"
-            login_request = httpx.post(
-                url, json=self.login_payload, headers=self.login_headers
+            login_request = await self._get_session().post(
+                self._AUTHURL, json=self.login_payload, headers=self.login_headers
             )
             login_request.raise_for_status()
             response = login_request.json()
@@ -53,8 +350,15 @@ class ComapClient(object):
                 "RefreshToken"
             )
             self.token_expires = response.get("AuthenticationResult").get("ExpiresIn")
+            self.metrics.logins += 1
+            self._tokens_updated()
 
         except httpx.HTTPStatusError as err:
+            if err.response.status_code not in (400, 401):
+                # Cognito is throttling or down, the credentials may be fine.
+                raise ComapClientException(
+                    "COMAP login service failed", err.response.status_code
+                ) from err
             _LOGGER.error(
                 "Could not set up COMAP client - %s status code. Check your credentials",
                 err.response.status_code,
@@ -62,43 +366,162 @@ class ComapClient(object):
             raise ComapClientAuthException(
                 "Client set up failed", err.response.status_code
             ) from err
+        except httpx.HTTPError as err:
+            raise ComapClientException("Could not reach the COMAP login service") from err
 
-    def get_request(self, url, headers=None, params={}):
-        if (datetime.now() - self.last_request).total_seconds() > (
-            self.token_expires - 60
-        ):
-            self.token_refresh()
-        if headers is None:
-            headers = {
-                "Authorization": "Bearer {}".format(self.token),
-                "Content-Type": "application/json",
-            }
-        r = httpx.get(url=url, headers=headers, params=params)
+    def token_is_valid(self, margin=TOKEN_EXPIRY_MARGIN):
+        """Return True if the access token is still usable for margin seconds."""
+        if not self.token:
+            return False
+        age = (datetime.now() - self.last_request).total_seconds()
+        return age < self.token_expires - margin
+
+    async def async_request(self, mode, url, headers=None, params={}, json={}):
+        self.circuit.before_request()
+        try:
+            r = await self._async_request_with_retries(mode, url, headers, params, json)
+        except httpx.TransportError:
+            self.circuit.record_failure()
+            raise
+        except BaseException:
+            self.circuit.record_aborted()
+            raise
+        if r.status_code == 429 or r.status_code >= 500:
+            self.circuit.record_failure()
+        else:
+            self.circuit.record_success()
         r.raise_for_status()
         return r.json()
 
-    async def async_request(self, mode, url, headers=None, params={}, json={}):
-        if (datetime.now() - self.last_request).total_seconds() > (
-            self.token_expires - 60
-        ):
-            _LOGGER.debug("Attempting refresh of access token")
-            self.token_refresh()
-        if headers is None:
-            headers = {
-                "Authorization": "Bearer {}".format(self.token),
-                "Content-Type": "application/json",
-            }
-        async with httpx.AsyncClient() as client:
+    async def _async_request_with_retries(self, mode, url, headers, params, json):
+        endpoint = self.metrics.endpoint(mode, url, self._BASEURL)
+        attempt = 0
+        reauthenticated = False
+        while True:
+            if await self._rate_limiter.acquire():
+                self.stats["rate_limited"] += 1
+            if not self.token_is_valid():
+                _LOGGER.debug("Attempting refresh of access token")
+                await self.token_refresh()
+            token = self.token
+            request_headers = headers
+            if request_headers is None:
+                request_headers = {
+                    "Authorization": "Bearer {}".format(token),
+                    "Content-Type": "application/json",
+                }
+            try:
+                r = await self._send(endpoint, mode, url, request_headers, params, json)
+            except httpx.TransportError as err:
+                # A write that may have reached the server is never replayed.
+                if attempt >= MAX_RETRIES or not (
+                    mode == "get" or isinstance(err, httpx.ConnectError)
+                ):
+                    raise
+                delay = self._backoff(attempt)
+                _LOGGER.debug("Retrying %s %s in %.1fs after %s", mode, url, delay, err)
+            else:
+                if r.status_code == 401 and headers is None and not reauthenticated:
+                    # The token was revoked before its expiry, for instance a
+                    # restored one. Renew it once, unless a concurrent request
+                    # already did, and send the request again.
+                    reauthenticated = True
+                    if self.token == token:
+                        _LOGGER.debug("Access token rejected, renewing it")
+                        self.token = ""
+                        await self.token_refresh()
+                    continue
+                # 429 means the request was refused, so it is safe to send any
+                # request again; server errors are only retried for reads.
+                retryable = r.status_code == 429 or (
+                    mode == "get" and r.status_code >= 500
+                )
+                if r.status_code == 429:
+                    self.stats["throttled"] += 1
+                if not retryable or attempt >= MAX_RETRIES:
+                    return r
+                delay = self._retry_delay(r, attempt)
+                _LOGGER.warning(
+                    "Comap API answered %s to %s %s, retrying in %.1fs",
+                    r.status_code,
+                    mode,
+                    url,
+                    delay,
+                )
+            self.stats["retries"] += 1
+            endpoint.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _send(self, endpoint, mode, url, headers, params, json):
+        async with self._request_semaphore:
+            if self._shared_semaphore is None:
+                return await self._send_now(endpoint, mode, url, headers, params, json)
+            async with self._shared_semaphore:
+                return await self._send_now(endpoint, mode, url, headers, params, json)
+
+    async def _send_now(self, endpoint, mode, url, headers, params, json):
+        client = self._get_session()
+        start = monotonic()
+        try:
             if mode == "post":
                 r = await client.post(url=url, headers=headers, json=json)
-            if mode == "put":
+            elif mode == "put":
                 r = await client.put(url=url, headers=headers, json=json)
             elif mode == "delete":
                 r = await client.delete(url=url, headers=headers)
             elif mode == "get":
                 r = await client.get(url=url, headers=headers, params=params)
-            r.raise_for_status()
-            return r.json()
+        except httpx.TransportError:
+            endpoint.record(monotonic() - start, None)
+            raise
+        endpoint.record(monotonic() - start, r.status_code, len(r.content))
+        return r
+
+    @staticmethod
+    def _backoff(attempt):
+        """Exponential backoff with jitter."""
+        delay = RETRY_BACKOFF * 2**attempt
+        return min(delay + random.uniform(0, delay), RETRY_MAX_DELAY)
+
+    def _retry_delay(self, response, attempt):
+        """Honour Retry-After when the server sends one."""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is None:
+            return self._backoff(attempt)
+        self.stats["last_retry_after"] = retry_after
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                return self._backoff(attempt)
+            delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+        return min(max(delay, 0), RETRY_MAX_DELAY)
+
+    def _get_session(self):
+        """Return the pooled HTTP client, creating it on first use."""
+        if self._session is None or self._session.is_closed:
+            self._session = httpx.AsyncClient(http2=HTTP2_AVAILABLE, limits=POOL_LIMITS)
+            self._owns_session = True
+        return self._session
+
+    async def close(self):
+        """Stop the token renewal and close the pooled HTTP connections.
+
+        A session the client does not own is left open for its owner.
+        """
+        if self._renew_handle is not None:
+            self._renew_handle.cancel()
+            self._renew_handle = None
+        for task in (self._renewal_task, self._refresh_task):
+            if task is not None and not task.done():
+                task.cancel()
+        if self._session is not None:
+            if self._owns_session:
+                await self._session.aclose()
+            self._session = None
 
     async def async_post(self, url, headers=None, json={}):
         return await self.async_request("post", url, headers, json=json)
@@ -112,42 +535,113 @@ class ComapClient(object):
     async def async_put(self, url, headers=None, json={}):
         return await self.async_request("put", url, headers, json=json)
 
-    def token_refresh(self):
-        url = "https://cognito-idp.eu-west-3.amazonaws.com"
-
-        with _TOKEN_LOCK:
-            headers = {
-                "Content-Type": "application/x-amz-json-1.1",
-                "x-amz-target": "AWSCognitoIdentityProviderService.InitiateAuth",
-                "origin": "https://app.comapsmarthome.com",
-                "referer": "https://app.comapsmarthome.com",
-            }
-            payload = {
-                "AuthFlow": "REFRESH_TOKEN_AUTH",
-                "AuthParameters": {"REFRESH_TOKEN": self.refresh_token},
-                "ClientId": self.clientid,
-            }
-
-            login_request = httpx.post(url, json=payload, headers=headers)
-            if login_request.status_code == 200:
-                response = login_request.json()
-                self.last_request = datetime.now()
-                self.token = response.get("AuthenticationResult").get("AccessToken")
-                self.token_expires = response.get("AuthenticationResult").get(
-                    "ExpiresIn"
-                )
-            else:
-                _LOGGER.error("Refresh token failed")
+    async def token_refresh(self):
+        """Renew the access token, sharing one in-flight renewal between callers."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(
+                self._async_refresh_token()
+            )
+        await asyncio.shield(self._refresh_task)
+
+    async def _async_refresh_token(self):
+        if not self.refresh_token:
+            await self.login()
+            return
+        headers = {
+            "Content-Type": "application/x-amz-json-1.1",
+            "x-amz-target": "AWSCognitoIdentityProviderService.InitiateAuth",
+            "origin": "https://app.comapsmarthome.com",
+            "referer": "https://app.comapsmarthome.com",
+        }
+        payload = {
+            "AuthFlow": "REFRESH_TOKEN_AUTH",
+            "AuthParameters": {"REFRESH_TOKEN": self.refresh_token},
+            "ClientId": self.clientid,
+        }
+
+        try:
+            login_request = await self._get_session().post(
+                self._AUTHURL, json=payload, headers=headers
+            )
+        except httpx.HTTPError as err:
+            raise ComapClientException("Could not reach the COMAP login service") from err
+        if login_request.status_code == 200:
+            response = login_request.json()
+            self.last_request = datetime.now()
+            self.token = response.get("AuthenticationResult").get("AccessToken")
+            self.token_expires = response.get("AuthenticationResult").get(
+                "ExpiresIn"
+            )
+            self.metrics.token_refreshes += 1
+            self._tokens_updated()
+        elif login_request.status_code in (400, 401):
+            _LOGGER.warning("Refresh token rejected, logging in again")
+            await self.login()
+        else:
+            _LOGGER.error("Refresh token failed")
+            raise ComapClientException(
+                "Token refresh failed", login_request.status_code
+            )
+
+    def _tokens_updated(self):
+        if self._schedule_renewals:
+            self._schedule_renewal()
+        if self.token_listener is not None:
+            self.token_listener(self.export_tokens())
+
+    def export_tokens(self):
+        """Return the Cognito tokens so they can be persisted."""
+        return {
+            "access_token": self.token,
+            "refresh_token": self.refresh_token,
+            "issued_at": self.last_request.timestamp(),
+            "expires_in": self.token_expires,
+        }
+
+    def restore_tokens(self, tokens):
+        """Resume a session saved with export_tokens, without any auth call."""
+        self.token = tokens["access_token"]
+        self.refresh_token = tokens["refresh_token"]
+        self.last_request = datetime.fromtimestamp(tokens["issued_at"])
+        self.token_expires = tokens["expires_in"]
+        if self._schedule_renewals and self.token_is_valid():
+            self._schedule_renewal()
+
+    def _schedule_renewal(self, delay=None):
+        """Renew the token in the background shortly before it expires."""
+        if self._renew_handle is not None:
+            self._renew_handle.cancel()
+        if delay is None:
+            age = (datetime.now() - self.last_request).total_seconds()
+            ahead = min(TOKEN_RENEW_AHEAD, self.token_expires * TOKEN_RENEW_AHEAD_SHARE)
+            delay = max(self.token_expires - age - ahead, TOKEN_RENEW_MIN_DELAY)
+        loop = asyncio.get_running_loop()
+        self._renew_handle = loop.call_later(delay, self._start_background_renewal)
+
+    def _start_background_renewal(self):
+        self._renew_handle = None
+        self._renewal_task = asyncio.get_running_loop().create_task(
+            self._async_background_renewal()
+        )
+
+    async def _async_background_renewal(self):
+        try:
+            await self.token_refresh()
+        except (ComapClientException, ComapClientAuthException) as err:
+            _LOGGER.warning("Background token renewal failed: %s", err)
+            self._schedule_renewal(TOKEN_RETRY_DELAY)
 
-    def get_housings(self):
-        return self.get_request(self._BASEURL + "park/housings")
-    
     async def async_get_housings(self):
         return await self.async_get(self._BASEURL + "park/housings")
     
-    async def async_gethousing_data(self):
+    async def async_gethousing_data(self, housing=None):
         housings = await self.async_get_housings()
-        return housings[0]
+        if housing is None:
+            return housings[0]
+        for housing_data in housings:
+            if housing_data.get("id") == housing:
+                return housing_data
+        raise ComapClientException("Unknown Comap housing", housing)
 
     async def get_zones(self, housing=None):
         if housing is None:
@@ -163,10 +657,10 @@ class ComapClient(object):
             self._BASEURL + "thermal/housings/" + housing + "/thermal-details"
         )
 
-    def get_zone(self, zoneid, housing=None):
+    async def get_zone(self, zoneid, housing=None):
         if housing is None:
             housing = self.housing
-        return self.get_request(
+        return await self.async_get(
             self._BASEURL
             + "thermal/housings/"
             + housing
@@ -179,7 +673,7 @@ class ComapClient(object):
         """Get a list of all objects in the specified housing"""
         if housing is None:
             housing = self.housing
-        return self.get_request(
+        return await self.async_get(
             self._BASEURL
             + "park/housings/"
             + housing
@@ -191,14 +685,14 @@ class ComapClient(object):
             housing = self.housing
         """Get eligible zones for specified object"""
         try:
-            return self.get_request(
-            self._BASEURL
-            + "thermal/housings/"
-            + housing
-            + "/eligible-zones/"
-            + serial
-        )
-        except:
+            return await self.async_get(
+                self._BASEURL
+                + "thermal/housings/"
+                + housing
+                + "/eligible-zones/"
+                + serial
+            )
+        except httpx.HTTPError:
             return None
 
     async def set_holiday(self, housing=None):
@@ -279,15 +773,7 @@ class ComapClient(object):
 
     async def get_active_program(self, housing=None):
         programs = await self.get_programs(housing)
-        active_program = None
-        try:
-            for program in programs["programs"]:
-                if program["is_activated"]:
-                    active_program = program
-        except AttributeError:
-            _LOGGER.error("Could not find active program for Comap housing")
-
-        return active_program
+        return find_active_program(programs)
 
     async def set_program(self, program, housing=None):
         if housing is None:
@@ -411,9 +897,26 @@ class ComapClient(object):
         )
 
 
+def find_active_program(programs):
+    """Return the activated program from a /programs response."""
+    active_program = None
+    try:
+        for program in programs["programs"]:
+            if program["is_activated"]:
+                active_program = program
+    except (AttributeError, KeyError, TypeError):
+        _LOGGER.error("Could not find active program for Comap housing")
+
+    return active_program
+
+
 class ComapClientException(Exception):
     """Exception with ComapSmartHome client."""
 
 
+class ComapClientUnavailable(ComapClientException):
+    """The Comap API is considered down and requests are failing fast."""
+
+
 class ComapClientAuthException(Exception):
     """Exception with ComapSmartHome client."""
\ No newline at end of file
@@ -1,79 +1,202 @@
+import asyncio
+from dataclasses import replace
 import logging
-from datetime import timedelta, datetime
+from datetime import datetime
+from time import monotonic
 from zoneinfo import ZoneInfo
 
-from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry
-from .const import DOMAIN
+from .models import (
+    ConnectedObject,
+    Housing,
+    Program,
+    Schedule,
+    TemperatureTable,
+    Zone,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
-async def setComapValues(hass,client):
-    hass.data[DOMAIN]["temperatures"] = await client.get_custom_temperatures()
-    hass.data[DOMAIN]["housing"] = await client.async_gethousing_data()
-    hass.data[DOMAIN]["thermal_details"] = await client.get_thermal_details()
-    hass.data[DOMAIN]["connected_objects"] = await client.get_housing_connected_objects()
-    hass.data[DOMAIN]["schedules"] = await client.get_schedules()
-    hass.data[DOMAIN]["programs"] = await client.get_programs()
-    hass.data[DOMAIN]["active_program"] = await client.get_active_program()
-
-async def refresh_all_comap_entities(hass, unique_id):
-
-    """Rafraîchit toutes les entités liées à un domaine spécifique."""
-    # Récupérer le registre des entités
-    entity_registry = async_get_entity_registry(hass)
-
-    # Trouver toutes les entités liées à l'identifiant de l'appareil
-    entities_to_refresh = [
-        entry.entity_id for entry in entity_registry.entities.values()
-        if (entry.platform == DOMAIN) & (entry.unique_id != unique_id)
-    ]
+SNAPSHOT_ENDPOINTS = {
+    "temperatures": lambda client, housing: client.get_custom_temperatures(housing),
+    "housing": lambda client, housing: client.async_gethousing_data(housing),
+    "thermal_details": lambda client, housing: client.get_thermal_details(housing),
+    "connected_objects": lambda client, housing: client.get_housing_connected_objects(housing),
+    "schedules": lambda client, housing: client.get_schedules(housing),
+    "programs": lambda client, housing: client.get_programs(housing),
+}
+
+async def setComapValues(
+    client, previous=None, endpoints=None, housing=None, timings=None
+):
+    """Fetch a snapshot of one housing, the client's default one if None.
+
+    Only the endpoints listed are fetched, the other resources are carried
+    over from the previous snapshot. If timings is a dict, the duration of
+    each fetch and of the indexing is stored in it, in seconds.
+    """
+    if previous is None or endpoints is None:
+        endpoints = SNAPSHOT_ENDPOINTS.keys()
+    keys = [key for key in SNAPSHOT_ENDPOINTS if key in endpoints]
+    # The endpoints are independent: fetch them concurrently, the client
+    # bounds how many requests are actually in flight.
+    results = await asyncio.gather(
+        *(_timed(key, client, housing, timings) for key in keys)
+    )
+    start = monotonic()
+    snapshot = index_snapshot(dict(zip(keys, results)), previous)
+    if timings is not None:
+        timings["index"] = monotonic() - start
+    return snapshot
+
+async def _timed(key, client, housing, timings):
+    # The request is only created once its task runs: a fetch cancelled
+    # before then leaves no coroutine never awaited behind.
+    if timings is None:
+        return await SNAPSHOT_ENDPOINTS[key](client, housing)
+    start = monotonic()
+    try:
+        return await SNAPSHOT_ENDPOINTS[key](client, housing)
+    finally:
+        timings["GET " + key] = monotonic() - start
+
+def index_snapshot(payloads, previous=None):
+    """Parse the payloads fetched into models and build the lookup tables.
+
+    The models are the only copy of the snapshot kept, the payloads are
+    dropped once parsed. The models built from the endpoints missing from
+    payloads are carried over from previous, which is required when
+    payloads does not hold every endpoint.
+    """
+    snapshot = dict(previous) if previous is not None else {}
 
-    # Rafraîchir chaque entité
-    for entity_id in entities_to_refresh:
+    if "thermal_details" in payloads:
+        zones_by_id = {}
+        for zone_data in payloads["thermal_details"].get("zones", []):
+            zone = Zone.from_dict(zone_data)
+            zones_by_id[zone.id] = zone
+        snapshot["zones_by_id"] = zones_by_id
+        snapshot["zone_by_serial"] = _zone_by_serial(zones_by_id)
+
+    if "connected_objects" in payloads:
+        objects_by_serial = {}
+        for obj_data in payloads["connected_objects"]:
+            obj = ConnectedObject.from_dict(obj_data)
+            objects_by_serial[obj.serial_number] = obj
+        snapshot["objects_by_serial"] = objects_by_serial
+
+    if "schedules" in payloads:
+        schedules_by_id = {}
+        for schedule_data in payloads["schedules"]:
+            schedule = Schedule.from_dict(schedule_data)
+            schedules_by_id[schedule.id] = schedule
+        snapshot["schedules_by_id"] = schedules_by_id
+
+    if "programs" in payloads:
+        programs_by_id = {}
+        active_program = None
         try:
-            await hass.services.async_call(
-                "homeassistant", "update_entity", {"entity_id": entity_id}
-            )
-        except:
-            pass
-
-async def refresh_main_entity (hass):
-    unique_id = hass.data[DOMAIN]["main_sensor_id"]
-    entity_registry = async_get_entity_registry(hass)
-    entities_to_refresh = [
-        entry.entity_id for entry in entity_registry.entities.values()
-        if (entry.platform == DOMAIN) & (entry.unique_id == unique_id)
+            for program_data in payloads["programs"]["programs"]:
+                program = Program.from_dict(program_data)
+                programs_by_id[program.id] = program
+                if program.is_activated:
+                    active_program = program
+        except (AttributeError, KeyError, TypeError):
+            _LOGGER.error("Could not find active program for Comap housing")
+        snapshot["programs_by_id"] = programs_by_id
+        snapshot["active_program"] = active_program
+        snapshot["active_schedule_by_zone"] = (
+            active_program.zone_schedules if active_program is not None else {}
+        )
+        snapshot["programming_type_by_zone"] = (
+            active_program.zone_programming_types if active_program is not None else {}
+        )
+
+    if "temperatures" in payloads:
+        snapshot["temperature_table"] = TemperatureTable.from_dict(
+            payloads["temperatures"]
+        )
+
+    fields = {}
+    if "housing" in payloads:
+        fields.update(Housing.housing_fields(payloads["housing"]))
+    if "thermal_details" in payloads:
+        fields.update(Housing.thermal_fields(payloads["thermal_details"]))
+    if previous is None:
+        snapshot["housing_info"] = Housing(**fields)
+    elif fields:
+        snapshot["housing_info"] = replace(previous["housing_info"], **fields)
+    return snapshot
+
+def _zone_by_serial(zones_by_id):
+    return {
+        obj_serial: zone
+        for zone in zones_by_id.values()
+        for obj_serial in zone.connected_objects
+    }
+
+def replace_zone(snapshot, zone):
+    """Return a copy of snapshot where zone replaces the zone of its id."""
+    zones_by_id = dict(snapshot["zones_by_id"])
+    zones_by_id[zone.id] = zone
+    return dict(
+        snapshot, zones_by_id=zones_by_id, zone_by_serial=_zone_by_serial(zones_by_id)
+    )
+
+def snapshot_payloads(snapshot):
+    """Rebuild the payload of every endpoint, as the API sent it, from the models."""
+    housing, thermal_details = snapshot["housing_info"].as_dicts()
+    thermal_details["zones"] = [
+        zone.as_dict() for zone in snapshot["zones_by_id"].values()
     ]
-    for entity_id in entities_to_refresh:
-        try:
-            await hass.services.async_call(
-                "homeassistant", "update_entity", {"entity_id": entity_id}
-            )
-        except:
-            pass
-
-def get_connected_object_zone_infos(object_sn, thermal_details):
-    zones = thermal_details.get("zones")
-    zone_id = None
-    zone_title = None
-    for zone in zones:
-        zone_obj = zone.get("connected_objects")
-        for obj_serial in zone_obj:
-            if obj_serial == object_sn:
-                zone_title = zone.get("title")
-                zone_id = zone.get("id")
     return {
-        "id": zone_id,
-        "title": zone_title
+        "temperatures": snapshot["temperature_table"].as_dict(),
+        "housing": housing,
+        "thermal_details": thermal_details,
+        "connected_objects": [
+            obj.as_dict() for obj in snapshot["objects_by_serial"].values()
+        ],
+        "schedules": [
+            schedule.as_dict() for schedule in snapshot["schedules_by_id"].values()
+        ],
+        "programs": {
+            "programs": [
+                program.as_dict() for program in snapshot["programs_by_id"].values()
+            ]
+        },
+    }
+
+def get_connected_object_zone_infos(object_sn, snapshot):
+    zone = snapshot["zone_by_serial"].get(object_sn)
+    if zone is None:
+        return {"id": None, "title": None}
+    return {
+        "id": zone.id,
+        "title": zone.title
     }
+
 def get_now():
     time_zone = ZoneInfo("Europe/Paris")
     return datetime.now(tz=time_zone).isoformat()
 
-def get_zone_thermal_details (zone_id,thermal_details):
-    zones = thermal_details.get("zones")
-    target_zone = None
-    for zone in zones:
-        if zone.get("id") == zone_id:
-            target_zone = zone
-    return target_zone
+def get_zone_thermal_details (zone_id,snapshot):
+    return snapshot["zones_by_id"].get(zone_id)
+
+def get_zone_temperature(zone_id, set_point_type, instruction, snapshot):
+    """Return the temperature an instruction sets a zone to, None if unknown."""
+    return snapshot["temperature_table"].temperature(
+        set_point_type, instruction, snapshot["programming_type_by_zone"].get(zone_id)
+    )
+
+def get_temperature_instruction(zone_id, temperature, snapshot):
+    """Return the instruction to write to set a zone to temperature.
+
+    defined_temperature zones are sent the named instruction set to that
+    temperature in their group, when there is one, other zones the value.
+    """
+    zone = snapshot["zones_by_id"].get(zone_id)
+    if zone is None or zone.set_point_type != "defined_temperature":
+        return temperature
+    instruction = snapshot["temperature_table"].instruction(
+        temperature, snapshot["programming_type_by_zone"].get(zone_id)
+    )
+    return temperature if instruction is None else instruction
@@ -1,17 +1,29 @@
 """Config flow to configure Comap smart home."""
 import logging
 
-from .comap import ComapClient, ComapClientException
+from .comap import ComapClient, ComapClientAuthException, ComapClientException
 import voluptuous as vol
 
 from homeassistant import config_entries
 from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import callback
+from homeassistant.helpers.httpx_client import get_async_client
 
-from .const import DOMAIN
+from .const import (
+    CONF_METADATA_INTERVAL,
+    CONF_OBJECTS_INTERVAL,
+    CONF_PROGRAMS_INTERVAL,
+    CONF_STALE_LIMIT,
+    CONF_THERMAL_INTERVAL,
+    DEFAULT_INTERVALS,
+    DEFAULT_STALE_LIMIT,
+    DOMAIN,
+)
 
 DATA_SCHEMA = vol.Schema(
     {vol.Required(CONF_USERNAME): str, vol.Required(CONF_PASSWORD): str}
 )
+REAUTH_SCHEMA = vol.Schema({vol.Required(CONF_PASSWORD): str})
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -21,21 +33,96 @@ class ComapFlowHandler(config_entries.ConfigFlow, domain=DOMAIN):
 
     VERSION = 1
 
+    _reauth_entry = None
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return ComapOptionsFlowHandler(config_entry)
+
     async def async_step_user(self, user_input=None):
         """Handle a flow initialized by the user."""
         errors = {}
         if user_input is not None:
-            try:
-                self._async_abort_entries_match(
-                    {CONF_USERNAME: user_input[CONF_USERNAME]}
-                )
-                client = ComapClient(username=user_input[CONF_USERNAME],password=user_input[CONF_PASSWORD])
-
-            except ComapClientException:
-                errors["base"] = "cannot_connect"
-            else:
+            self._async_abort_entries_match(
+                {CONF_USERNAME: user_input[CONF_USERNAME]}
+            )
+            errors = await self._async_check_credentials(user_input)
+            if not errors:
                 return self.async_create_entry(title=DOMAIN, data=user_input)
 
         return self.async_show_form(
             step_id="user", data_schema=DATA_SCHEMA, errors=errors
-        )
\ No newline at end of file
+        )
+
+    async def async_step_reauth(self, entry_data):
+        """Handle a password rejected by Cognito."""
+        self._reauth_entry = self.hass.config_entries.async_get_entry(
+            self.context["entry_id"]
+        )
+        return await self.async_step_reauth_confirm()
+
+    async def async_step_reauth_confirm(self, user_input=None):
+        """Ask for the new password of the account."""
+        errors = {}
+        if user_input is not None:
+            data = dict(self._reauth_entry.data, **user_input)
+            errors = await self._async_check_credentials(data)
+            if not errors:
+                return self.async_update_reload_and_abort(self._reauth_entry, data=data)
+
+        return self.async_show_form(
+            step_id="reauth_confirm",
+            data_schema=REAUTH_SCHEMA,
+            description_placeholders={
+                CONF_USERNAME: self._reauth_entry.data[CONF_USERNAME]
+            },
+            errors=errors,
+        )
+
+    async def _async_check_credentials(self, user_input):
+        """Log in with user_input, return the errors to show."""
+        try:
+            # Only checks the credentials: no token renewal is armed and the
+            # shared session is left open.
+            client = await ComapClient.async_create(
+                username=user_input[CONF_USERNAME],
+                password=user_input[CONF_PASSWORD],
+                session=get_async_client(self.hass),
+                schedule_renewal=False,
+            )
+        except ComapClientAuthException:
+            return {"base": "invalid_auth"}
+        except ComapClientException:
+            return {"base": "cannot_connect"}
+        await client.close()
+        return {}
+
+
+class ComapOptionsFlowHandler(config_entries.OptionsFlow):
+    """Handle the polling intervals of a ComapSmartHome entry."""
+
+    def __init__(self, config_entry):
+        self.config_entry = config_entry
+
+    async def async_step_init(self, user_input=None):
+        if user_input is not None:
+            return self.async_create_entry(title="", data=user_input)
+
+        options = self.config_entry.options
+        defaults = dict(DEFAULT_INTERVALS, **{CONF_STALE_LIMIT: DEFAULT_STALE_LIMIT})
+        schema = vol.Schema(
+            {
+                vol.Required(
+                    key, default=options.get(key, defaults[key])
+                ): vol.All(vol.Coerce(int), vol.Range(min=minimum))
+                for key, minimum in (
+                    (CONF_THERMAL_INTERVAL, 1),
+                    (CONF_PROGRAMS_INTERVAL, 5),
+                    (CONF_OBJECTS_INTERVAL, 5),
+                    (CONF_METADATA_INTERVAL, 30),
+                    (CONF_STALE_LIMIT, 5),
+                )
+            }
+        )
+        return self.async_show_form(step_id="init", data_schema=schema)
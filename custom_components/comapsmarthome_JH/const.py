@@ -6,5 +6,45 @@ SERVICE_SET_AWAY = "set_away"
 SERVICE_SET_HOME = "set_home"
 SERVICE_SET_SCHEDULE = "set_schedule"
 ATTR_SCHEDULE_NAME = "schedule_name"
+SERVICE_SET_ZONES_INSTRUCTIONS = "set_zones_instructions"
+SERVICE_GET_API_METRICS = "get_api_metrics"
+SERVICE_PROFILE_REFRESH = "profile_refresh"
+ATTR_CYCLES = "cycles"
+ATTR_FULL_REFRESH = "full_refresh"
+ATTR_INSTRUCTIONS = "instructions"
+ATTR_DURATION = "duration"
+ATTR_MAX_PARALLEL = "max_parallel"
+ATTR_CONFIG_ENTRY_ID = "config_entry_id"
+DEFAULT_MAX_PARALLEL = 4
 
-ASSIST_COMPATIBILITY = "assitant-compatibility"
\ No newline at end of file
+# hass.data key of the request semaphore shared by every config entry.
+DATA_REQUEST_SEMAPHORE = DOMAIN + "_request_semaphore"
+
+ASSIST_COMPATIBILITY = "assitant-compatibility"
+
+# Options: refresh interval, in minutes, of each group of endpoints.
+CONF_THERMAL_INTERVAL = "thermal_interval"
+CONF_PROGRAMS_INTERVAL = "programs_interval"
+CONF_OBJECTS_INTERVAL = "objects_interval"
+CONF_METADATA_INTERVAL = "metadata_interval"
+
+DEFAULT_INTERVALS = {
+    CONF_THERMAL_INTERVAL: 5,
+    CONF_PROGRAMS_INTERVAL: 30,
+    CONF_OBJECTS_INTERVAL: 60,
+    CONF_METADATA_INTERVAL: 720,
+}
+
+# Options: minutes the last good snapshot is served while the API is down.
+CONF_STALE_LIMIT = "stale_limit"
+DEFAULT_STALE_LIMIT = 30
+
+# Snapshot key -> option holding its refresh interval.
+ENDPOINT_INTERVALS = {
+    "thermal_details": CONF_THERMAL_INTERVAL,
+    "programs": CONF_PROGRAMS_INTERVAL,
+    "connected_objects": CONF_OBJECTS_INTERVAL,
+    "housing": CONF_METADATA_INTERVAL,
+    "schedules": CONF_METADATA_INTERVAL,
+    "temperatures": CONF_METADATA_INTERVAL,
+}
\ No newline at end of file
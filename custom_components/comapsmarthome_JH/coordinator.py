@@ -0,0 +1,462 @@
+"""Data update coordinator for the ComapSmartHome integration."""
+
+import asyncio
+from collections import deque
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+import logging
+from time import monotonic, time
+
+import httpx
+
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import ConfigEntryAuthFailed, ServiceValidationError
+from homeassistant.helpers import device_registry as dr
+from homeassistant.helpers.storage import Store
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .comap import ComapClient, ComapClientAuthException, ComapClientException
+from .comap_functions import (
+    SNAPSHOT_ENDPOINTS,
+    index_snapshot,
+    replace_zone,
+    setComapValues,
+    snapshot_payloads,
+)
+from .const import (
+    CONF_STALE_LIMIT,
+    CONF_THERMAL_INTERVAL,
+    DEFAULT_INTERVALS,
+    DEFAULT_STALE_LIMIT,
+    DOMAIN,
+    ENDPOINT_INTERVALS,
+)
+from .models import Zone
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+# Seconds to wait before writing a changed snapshot to storage.
+STORAGE_SAVE_DELAY = 60
+
+# Seconds after a targeted refresh starts during which the refresh requests
+# following writes are merged into the next one.
+REFRESH_COALESCE_WINDOW = 1.5
+
+# Number of refresh cycles whose timings are kept for the diagnostics.
+REFRESH_TRACE_COUNT = 10
+
+# Parts of a snapshot shown by the housing-wide entities.
+HOUSING_KEYS = (
+    "housing_info",
+    "temperature_table",
+    "schedules_by_id",
+    "programs_by_id",
+)
+
+def all_coordinators(hass: HomeAssistant):
+    """Yield the coordinators of every loaded config entry."""
+    for entry_data in hass.data.get(DOMAIN, {}).values():
+        yield from entry_data["coordinators"].values()
+
+
+def target_coordinators(hass: HomeAssistant, device_ids=(), entry_ids=()):
+    """Return the coordinators of the housings targeted by a service call.
+
+    A housing is targeted by its device, the device of one of its zones or
+    the config entry of its account.
+    """
+    entries = hass.data.get(DOMAIN, {})
+    # Ordered set, a housing can be targeted more than once.
+    coordinators = {}
+    for entry_id in entry_ids:
+        if entry_id not in entries:
+            raise ServiceValidationError(f"Unknown Comap config entry: {entry_id}")
+        coordinators.update(dict.fromkeys(entries[entry_id]["coordinators"].values()))
+    device_registry = dr.async_get(hass)
+    for device_id in device_ids:
+        device = device_registry.async_get(device_id)
+        identifiers = set()
+        if device is not None:
+            identifiers = {
+                value for domain, value in device.identifiers if domain == DOMAIN
+            }
+        targeted = [
+            coordinator
+            for coordinator in all_coordinators(hass)
+            if coordinator.housing_id in identifiers
+            or not identifiers.isdisjoint(coordinator.data["zones_by_id"])
+        ]
+        if not targeted:
+            raise ServiceValidationError(f"Not a Comap housing or zone: {device_id}")
+        coordinators.update(dict.fromkeys(targeted))
+    return list(coordinators)
+
+
+class ComapSnapshotStore:
+    """Persist the snapshots of every housing of a config entry in one file."""
+
+    def __init__(self, hass: HomeAssistant, entry_id) -> None:
+        self._store = Store(hass, STORAGE_VERSION, DOMAIN + "." + entry_id)
+        self.coordinators = []
+
+    async def async_load(self):
+        """Return the saved snapshots, one per housing, or None."""
+        cached = await self._store.async_load()
+        if cached is None:
+            return None
+        if "snapshot" in cached:
+            # Written before housings were handled separately.
+            return [cached]
+        return cached["housings"]
+
+    def async_schedule_save(self):
+        self._store.async_delay_save(self.data_to_save, STORAGE_SAVE_DELAY)
+
+    def data_to_save(self):
+        return {
+            "housings": [
+                coordinator.data_to_save()
+                for coordinator in self.coordinators
+                if coordinator.data is not None
+            ]
+        }
+
+    async def async_remove(self):
+        await self._store.async_remove()
+
+
+class ComapDataUpdateCoordinator(DataUpdateCoordinator):
+    """Own the snapshot of one housing and notify its entities on refresh."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        client: ComapClient,
+        housing_id,
+        options=None,
+        store=None,
+    ) -> None:
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=DOMAIN + "_" + housing_id,
+        )
+        self.client = client
+        self.housing_id = housing_id
+        self._store = store
+        self._last_fetched = {}
+        self._invalidated = set()
+        self._pending_endpoints = set()
+        self._pending_refresh = None
+        self._coalesce_timer = None
+        self._coalesced_refresh = None
+        self._last_coalesced_start = None
+        self.last_success_time = None
+        self.last_error = None
+        self.set_options(options or {})
+        self.changed_zones = set()
+        self.changed_objects = set()
+        self.housing_changed = True
+        self.refresh_traces = deque(maxlen=REFRESH_TRACE_COUNT)
+        self._unfinished_trace = None
+        # Held by fetches and by the patches of our writes: a fetch carries
+        # over the snapshot it started from, a patch applied meanwhile would
+        # be lost.
+        self._data_lock = asyncio.Lock()
+
+    def set_options(self, options):
+        """Apply the refresh intervals and staleness limit (minutes) from options."""
+        self.stale_limit = options.get(CONF_STALE_LIMIT, DEFAULT_STALE_LIMIT) * 60
+        self.intervals = {
+            key: options.get(key, default) for key, default in DEFAULT_INTERVALS.items()
+        }
+        # The coordinator ticks at the pace of the fastest tier.
+        self.update_interval = timedelta(minutes=self.intervals[CONF_THERMAL_INTERVAL])
+
+    @property
+    def snapshot_age(self):
+        """Seconds since the snapshot was last fetched successfully."""
+        if self.last_success_time is None:
+            return None
+        return time() - self.last_success_time
+
+    def async_restore(self, cached):
+        """Serve a snapshot saved by a previous run until the next refresh."""
+        data = index_snapshot(
+            {key: cached["snapshot"][key] for key in SNAPSHOT_ENDPOINTS}
+        )
+        # The next refresh is compared with the cached copy.
+        self.data = data
+        self.last_success_time = cached["saved_at"]
+
+    def data_to_save(self):
+        return {
+            "housing_id": self.housing_id,
+            "saved_at": self.last_success_time,
+            "snapshot": snapshot_payloads(self.data),
+        }
+
+    def invalidate(self, *endpoints):
+        """Force the given endpoints to be refetched on the next refresh."""
+        self._invalidated.update(endpoints)
+
+    def _due_endpoints(self):
+        now = monotonic()
+        due = set(self._invalidated)
+        for key in SNAPSHOT_ENDPOINTS:
+            last = self._last_fetched.get(key)
+            interval = self.intervals[ENDPOINT_INTERVALS[key]] * 60
+            # Leave some slack so a tier is not pushed back by a whole tick.
+            if last is None or now - last >= interval - 30:
+                due.add(key)
+        return due
+
+    def zone_changed(self, zone_id) -> bool:
+        return zone_id in self.changed_zones
+
+    def object_changed(self, serial) -> bool:
+        return serial in self.changed_objects
+
+    def _track_changes(self, data):
+        """Compare the models of data with those of the current snapshot.
+
+        Models carried over from the current snapshot are the same objects
+        and compare equal at once.
+        """
+        previous = self.data
+        if previous is None:
+            self.changed_zones = set(data["zones_by_id"])
+            self.changed_objects = set(data["objects_by_serial"])
+            self.housing_changed = True
+        else:
+            previous_zones = previous["zones_by_id"]
+            self.changed_zones = {
+                zone_id
+                for zone_id, zone in data["zones_by_id"].items()
+                if previous_zones.get(zone_id) != zone
+            }
+            previous_objects = previous["objects_by_serial"]
+            self.changed_objects = {
+                serial
+                for serial, obj in data["objects_by_serial"].items()
+                if previous_objects.get(serial) != obj
+            }
+            self.housing_changed = any(
+                data[key] != previous[key] for key in HOUSING_KEYS
+            )
+        if self._store is not None and (
+            self.changed_zones or self.changed_objects or self.housing_changed
+        ):
+            self._store.async_schedule_save()
+        _LOGGER.debug(
+            "Comap refresh of %s changed %d zones, %d objects, housing: %s",
+            self.housing_id,
+            len(self.changed_zones),
+            len(self.changed_objects),
+            self.housing_changed,
+        )
+
+    async def _async_fetch(self, endpoints):
+        async with self._data_lock:
+            return await self._async_fetch_locked(endpoints)
+
+    async def _async_fetch_locked(self, endpoints):
+        timings = {}
+        trace = {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "endpoints": sorted(endpoints),
+            "timings": timings,
+            "error": None,
+        }
+        start = monotonic()
+        try:
+            if not self.client.token_is_valid():
+                await self.client.token_refresh()
+                timings["auth"] = monotonic() - start
+            data = await setComapValues(
+                self.client, self.data, endpoints, self.housing_id, timings
+            )
+            now = monotonic()
+            for key in endpoints:
+                self._last_fetched[key] = now
+            self._invalidated.difference_update(endpoints)
+            self.last_success_time = time()
+            self.last_error = None
+            self._track_changes(data)
+            timings["track_changes"] = monotonic() - now
+        except BaseException as err:
+            trace["error"] = str(err) or type(err).__name__
+            raise
+        else:
+            # The entity fan-out is timed when the listeners are called.
+            self._unfinished_trace = trace
+        finally:
+            trace["duration"] = monotonic() - start
+            self.refresh_traces.append(trace)
+        return data
+
+    @callback
+    def async_update_listeners(self) -> None:
+        trace, self._unfinished_trace = self._unfinished_trace, None
+        start = monotonic()
+        super().async_update_listeners()
+        if trace is not None:
+            trace["timings"]["fan_out"] = monotonic() - start
+            trace["listeners"] = len(self._listeners)
+
+    async def _async_update_data(self):
+        try:
+            return await self._async_fetch(self._due_endpoints())
+        except ComapClientAuthException as err:
+            raise ConfigEntryAuthFailed from err
+        except (ComapClientException, httpx.HTTPError) as err:
+            self.last_error = str(err) or type(err).__name__
+            age = self.snapshot_age
+            if self.data is None or age is None or age > self.stale_limit:
+                raise UpdateFailed(f"Error communicating with Comap API: {err}") from err
+            # Keep serving the last good snapshot until it gets too old.
+            _LOGGER.warning(
+                "Comap API unavailable (%s), serving a %d seconds old snapshot",
+                self.last_error,
+                age,
+            )
+            self.changed_zones = set()
+            self.changed_objects = set()
+            self.housing_changed = False
+            return self.data
+
+    def _async_publish(self, data):
+        """Notify the entities affected by a patched snapshot.
+
+        Called with _data_lock held.
+        """
+        self._track_changes(data)
+        self.async_set_updated_data(data)
+
+    async def async_refresh_endpoints(self, *endpoints):
+        """Refetch only the given endpoints after one of our writes.
+
+        A request starts its fetch at once. Requests arriving within
+        REFRESH_COALESCE_WINDOW of the last start are merged into a single
+        trailing fetch of the union of their endpoints, which every one of
+        them awaits.
+        """
+        self._pending_endpoints.update(endpoints)
+        future = self._pending_refresh
+        if future is None:
+            future = self._pending_refresh = self.hass.loop.create_future()
+            delay = 0
+            if self._last_coalesced_start is not None:
+                window_end = self._last_coalesced_start + REFRESH_COALESCE_WINDOW
+                delay = window_end - monotonic()
+            if delay > 0:
+                self._coalesce_timer = self.hass.loop.call_later(
+                    delay, self._start_coalesced_refresh
+                )
+            else:
+                self._start_coalesced_refresh()
+        await asyncio.shield(future)
+
+    def _start_coalesced_refresh(self):
+        self._coalesce_timer = None
+        self._last_coalesced_start = monotonic()
+        future, self._pending_refresh = self._pending_refresh, None
+        endpoints, self._pending_endpoints = self._pending_endpoints, set()
+        self._coalesced_refresh = self.hass.async_create_task(
+            self._async_coalesced_refresh(future, endpoints)
+        )
+
+    async def async_shutdown(self) -> None:
+        """Cancel the merged refreshes not done yet, then stop the updates."""
+        if self._coalesce_timer is not None:
+            self._coalesce_timer.cancel()
+            self._coalesce_timer = None
+        if self._pending_refresh is not None:
+            self._pending_refresh.cancel()
+            self._pending_refresh = None
+            self._pending_endpoints = set()
+        if self._coalesced_refresh is not None:
+            self._coalesced_refresh.cancel()
+        await super().async_shutdown()
+
+    async def _async_coalesced_refresh(self, future, endpoints):
+        # Every path resolves future, its waiters would hang otherwise.
+        try:
+            try:
+                data = await self._async_fetch(endpoints)
+            except (ComapClientException, httpx.HTTPError) as err:
+                _LOGGER.warning(
+                    "Targeted Comap refresh failed, doing a full one: %s", err
+                )
+                self.invalidate(*endpoints)
+                await self.async_request_refresh()
+            else:
+                self.async_set_updated_data(data)
+        except Exception as err:  # pylint: disable=broad-except
+            future.set_exception(err)
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(None)
+
+    async def async_apply_zone_response(self, zone_id, response):
+        """Merge the zone returned by a write into the snapshot."""
+        if not _is_zone(response):
+            # The write did not echo the zone, re-read just that zone.
+            try:
+                response = await self.client.get_zone(zone_id, self.housing_id)
+            except (ComapClientException, httpx.HTTPError) as err:
+                _LOGGER.warning("Could not re-read Comap zone %s: %s", zone_id, err)
+                await self.async_refresh_endpoints("thermal_details")
+                return
+            if not _is_zone(response):
+                await self.async_refresh_endpoints("thermal_details")
+                return
+
+        async with self._data_lock:
+            zone = self.data["zones_by_id"].get(zone_id)
+            if zone is None:
+                return
+            zone = Zone.from_dict(dict(zone.as_dict(), **response))
+            self._async_publish(replace_zone(self.data, zone))
+
+    async def async_set_zones_instructions(self, instructions, duration, max_parallel):
+        """Write temporary instructions to many zones, then refresh once.
+
+        Returns a per-zone report of the writes.
+        """
+        semaphore = asyncio.Semaphore(max_parallel)
+
+        async def _set_instruction(zone_id, instruction):
+            async with semaphore:
+                try:
+                    await self.client.set_temporary_instruction(
+                        zone_id, instruction, duration=duration, housing=self.housing_id
+                    )
+                except (ComapClientException, httpx.HTTPError) as err:
+                    _LOGGER.warning("Could not set instruction of zone %s: %s", zone_id, err)
+                    return {"success": False, "error": str(err)}
+                return {"success": True}
+
+        results = await asyncio.gather(
+            *(
+                _set_instruction(zone_id, instruction)
+                for zone_id, instruction in instructions.items()
+            )
+        )
+        report = dict(zip(instructions, results))
+        if any(result["success"] for result in results):
+            await self.async_refresh_endpoints("thermal_details")
+        return report
+
+    async def async_set_heating_system_state(self, state):
+        """Record a heating system state we just wrote."""
+        async with self._data_lock:
+            housing_info = replace(self.data["housing_info"], heating_system_state=state)
+            self._async_publish(dict(self.data, housing_info=housing_info))
+
+
+def _is_zone(response):
+    return isinstance(response, dict) and "set_point" in response and "events" in response
@@ -0,0 +1,71 @@
+"""Diagnostics support for the ComapSmartHome integration."""
+
+from collections import Counter
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import entity_registry as er
+
+from .comap_functions import snapshot_payloads
+from .const import DOMAIN
+
+TO_REDACT = {
+    CONF_USERNAME,
+    CONF_PASSWORD,
+    "address",
+    "name",
+    "latitude",
+    "longitude",
+    "email",
+    "first_name",
+    "last_name",
+    "phone",
+    "access_token",
+    "refresh_token",
+}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return the state, refresh timings and API metrics of a config entry."""
+    entry_data = hass.data[DOMAIN][entry.entry_id]
+    client = entry_data["client"]
+
+    entity_registry = er.async_get(hass)
+    entities = Counter(
+        registry_entry.domain
+        for registry_entry in er.async_entries_for_config_entry(
+            entity_registry, entry.entry_id
+        )
+    )
+
+    housings = {}
+    for housing_id, coordinator in entry_data["coordinators"].items():
+        snapshot = None
+        if coordinator.data is not None:
+            snapshot = snapshot_payloads(coordinator.data)
+        housings[housing_id] = {
+            "last_update_success": coordinator.last_update_success,
+            "last_error": coordinator.last_error,
+            "snapshot_age": coordinator.snapshot_age,
+            "update_interval": coordinator.update_interval.total_seconds(),
+            "intervals": coordinator.intervals,
+            "stale_limit": coordinator.stale_limit,
+            "refresh_traces": list(coordinator.refresh_traces),
+            "snapshot": async_redact_data(snapshot, TO_REDACT),
+        }
+
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "entities": dict(entities),
+        "housings": housings,
+        "api": {
+            "circuit": client.circuit.state,
+            "stats": client.stats,
+            "metrics": client.metrics.as_dict(),
+        },
+    }
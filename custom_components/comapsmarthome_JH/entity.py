@@ -0,0 +1,29 @@
+"""Base entity for the ComapSmartHome integration."""
+
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .coordinator import ComapDataUpdateCoordinator
+
+
+class ComapEntity(CoordinatorEntity[ComapDataUpdateCoordinator]):
+    """Coordinator entity that only writes its state when its data changed."""
+
+    def __init__(self, coordinator: ComapDataUpdateCoordinator) -> None:
+        super().__init__(coordinator)
+        self._last_available = coordinator.last_update_success
+
+    def _data_changed(self) -> bool:
+        """Return True if the last refresh touched the data of this entity."""
+        return True
+
+    def _update_from_data(self):
+        """Rebuild the entity attributes from the coordinator snapshot."""
+
+    def _handle_coordinator_update(self) -> None:
+        available = self.available
+        if not self._data_changed() and available == self._last_available:
+            return
+        self._last_available = available
+        if self._update_from_data() is False:
+            return
+        super()._handle_coordinator_update()
@@ -0,0 +1,336 @@
+"""Immutable models of a Comap housing snapshot.
+
+The raw API payloads are parsed once per refresh by index_snapshot and the
+models are shared read-only by every entity. The models are the only copy
+of the snapshot kept, the payloads are dropped once parsed: each model
+keeps the fields the integration reads and rebuilds them in the shape of
+the API with as_dict, for persistence and diagnostics. Models compare
+equal when the entities built on them would show the same state.
+"""
+
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping
+
+_EMPTY = MappingProxyType({})
+
+# Groups of custom-temperatures, named after the programming type of zones.
+TEMPERATURE_GROUPS = ("connected", "smart")
+
+
+def _read_only(data) -> Mapping[str, Any]:
+    return MappingProxyType(data) if data else _EMPTY
+
+
+@dataclass(frozen=True, slots=True)
+class TemporaryInstruction:
+    """Instruction overriding the schedule of a zone until end_at."""
+
+    instruction: Any
+    end_at: str | None
+    # Payload as sent by the API, exposed in the state attributes.
+    raw: Mapping[str, Any]
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            instruction=(data.get("set_point") or {}).get("instruction"),
+            end_at=data.get("end_at"),
+            raw=_read_only(data),
+        )
+
+    def as_dict(self):
+        return dict(self.raw)
+
+
+@dataclass(frozen=True, slots=True)
+class Zone:
+    """Heating zone of a housing, from thermal-details."""
+
+    id: str
+    title: str
+    set_point_type: str | None
+    instruction: Any
+    temperature: float | None
+    humidity: int | None
+    heating_status: str | None
+    last_presence_detected: str | None
+    next_timeslot_begin_at: str | None
+    next_instruction: Any
+    temporary_instruction: TemporaryInstruction | None
+    connected_objects: tuple[str, ...]
+
+    @classmethod
+    def from_dict(cls, data):
+        next_timeslot = data.get("next_timeslot") or {}
+        temporary_instruction = (data.get("events") or {}).get("temporary_instruction")
+        return cls(
+            id=data.get("id"),
+            title=data.get("title") or "",
+            set_point_type=data.get("set_point_type"),
+            instruction=(data.get("set_point") or {}).get("instruction"),
+            temperature=data.get("temperature"),
+            humidity=data.get("humidity"),
+            heating_status=data.get("heating_status"),
+            last_presence_detected=data.get("last_presence_detected"),
+            next_timeslot_begin_at=next_timeslot.get("begin_at"),
+            next_instruction=(next_timeslot.get("set_point") or {}).get("instruction"),
+            temporary_instruction=(
+                None
+                if temporary_instruction is None
+                else TemporaryInstruction.from_dict(temporary_instruction)
+            ),
+            connected_objects=tuple(data.get("connected_objects", ())),
+        )
+
+    def as_dict(self):
+        events = {}
+        if self.temporary_instruction is not None:
+            events["temporary_instruction"] = self.temporary_instruction.as_dict()
+        return {
+            "id": self.id,
+            "title": self.title,
+            "set_point_type": self.set_point_type,
+            "set_point": {"instruction": self.instruction},
+            "temperature": self.temperature,
+            "humidity": self.humidity,
+            "heating_status": self.heating_status,
+            "last_presence_detected": self.last_presence_detected,
+            "next_timeslot": {
+                "begin_at": self.next_timeslot_begin_at,
+                "set_point": {"instruction": self.next_instruction},
+            },
+            "events": events,
+            "connected_objects": list(self.connected_objects),
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class Housing:
+    """Housing metadata and its housing-wide thermal state."""
+
+    id: str
+    name: str
+    address: Any
+    heating_system_state: str | None
+    services_available: Any
+    absence: Mapping[str, Any] | None
+    time_shift: Mapping[str, Any] | None
+
+    @classmethod
+    def from_dicts(cls, housing, thermal_details):
+        return cls(
+            **cls.housing_fields(housing), **cls.thermal_fields(thermal_details)
+        )
+
+    @staticmethod
+    def housing_fields(housing):
+        """Return the fields read from the housing payload."""
+        return {
+            "id": housing.get("id"),
+            "name": housing.get("name") or "",
+            "address": housing.get("address"),
+        }
+
+    @staticmethod
+    def thermal_fields(thermal_details):
+        """Return the fields read from the housing-wide part of thermal-details."""
+        events = thermal_details.get("events") or {}
+        absence = events.get("absence")
+        time_shift = events.get("time_shift")
+        return {
+            "heating_system_state": thermal_details.get("heating_system_state"),
+            "services_available": thermal_details.get("services_available"),
+            "absence": None if absence is None else _read_only(absence),
+            "time_shift": None if time_shift is None else _read_only(time_shift),
+        }
+
+    def as_dicts(self):
+        """Return the housing payload and thermal-details without its zones."""
+        events = {}
+        if self.absence is not None:
+            events["absence"] = dict(self.absence)
+        if self.time_shift is not None:
+            events["time_shift"] = dict(self.time_shift)
+        housing = {"id": self.id, "name": self.name, "address": self.address}
+        thermal_details = {
+            "heating_system_state": self.heating_system_state,
+            "services_available": self.services_available,
+            "events": events,
+        }
+        return housing, thermal_details
+
+
+@dataclass(frozen=True, slots=True)
+class ConnectedObject:
+    """Thermostat, heating module or gateway of a housing."""
+
+    serial_number: str
+    model: str
+    voltage_percent: int | None
+    communication_status: str | None
+    # Every field sent by the API, exposed in the state attributes.
+    attributes: Mapping[str, Any]
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            serial_number=data.get("serial_number"),
+            model=data.get("model") or "",
+            voltage_percent=data.get("voltage_percent"),
+            communication_status=data.get("communication_status"),
+            attributes=_read_only(data),
+        )
+
+    def as_dict(self):
+        return dict(self.attributes)
+
+
+@dataclass(frozen=True, slots=True)
+class Schedule:
+    """Weekly schedule that can be assigned to a zone."""
+
+    id: str
+    title: str
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(id=data.get("id"), title=data.get("title"))
+
+    def as_dict(self):
+        return {"id": self.id, "title": self.title}
+
+
+@dataclass(frozen=True, slots=True)
+class Program:
+    """Set of zone schedules, one program of a housing is active."""
+
+    id: str
+    title: str
+    is_activated: bool
+    # Zone id -> schedule id.
+    zone_schedules: Mapping[str, str]
+    # Zone id -> programming type, connected or smart.
+    zone_programming_types: Mapping[str, str]
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            id=data.get("id"),
+            title=data.get("title"),
+            is_activated=bool(data.get("is_activated")),
+            zone_schedules=_read_only(
+                {
+                    zone.get("id"): zone.get("schedule_id")
+                    for zone in data.get("zones", [])
+                }
+            ),
+            zone_programming_types=_read_only(
+                {
+                    zone.get("id"): zone.get("programming_type")
+                    for zone in data.get("zones", [])
+                    if zone.get("programming_type") is not None
+                }
+            ),
+        )
+
+    def as_dict(self):
+        zones = []
+        for zone_id, schedule_id in self.zone_schedules.items():
+            zone = {"id": zone_id, "schedule_id": schedule_id}
+            if zone_id in self.zone_programming_types:
+                zone["programming_type"] = self.zone_programming_types[zone_id]
+            zones.append(zone)
+        return {
+            "id": self.id,
+            "title": self.title,
+            "is_activated": self.is_activated,
+            "zones": zones,
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class TemperatureTable:
+    """Temperatures of the named instructions, from custom-temperatures.
+
+    Built once per custom-temperatures payload and shared by every zone.
+    A zone reads the top-level values, then the group of its programming
+    type. Zones of an unknown type, or of a type without a group, read the
+    top-level values, then the connected group, then the smart one.
+    """
+
+    # Group -> instruction -> temperature as sent by the API, the None group
+    # being the top-level values.
+    values: Mapping[str | None, Mapping[str, float]]
+    # Group -> instruction -> temperature, for defined_temperature zones.
+    # The None group serves the zones of an unknown type.
+    temperatures: Mapping[str | None, Mapping[str, float]]
+    # Group -> temperature -> instruction, to write named instructions.
+    instructions: Mapping[str | None, Mapping[float, str]]
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, Mapping):
+            data = {}
+        values = {None: _temperature_values(data)}
+        for group in TEMPERATURE_GROUPS:
+            if isinstance(data.get(group), Mapping):
+                values[group] = _temperature_values(data[group])
+        sources = {
+            None: [values[None]]
+            + [values[group] for group in TEMPERATURE_GROUPS if group in values]
+        }
+        for group in TEMPERATURE_GROUPS:
+            if group in values:
+                sources[group] = [values[None], values[group]]
+        temperatures = {}
+        instructions = {}
+        for group, groups in sources.items():
+            group_temperatures = {}
+            for source in groups:
+                for instruction, temperature in source.items():
+                    group_temperatures.setdefault(instruction, temperature)
+            group_instructions = {}
+            for instruction, temperature in group_temperatures.items():
+                group_instructions.setdefault(float(temperature), instruction)
+            temperatures[group] = _read_only(group_temperatures)
+            instructions[group] = _read_only(group_instructions)
+        return cls(
+            values=_read_only(
+                {
+                    group: _read_only(group_values)
+                    for group, group_values in values.items()
+                }
+            ),
+            temperatures=_read_only(temperatures),
+            instructions=_read_only(instructions),
+        )
+
+    def as_dict(self):
+        data = dict(self.values[None])
+        for group, group_values in self.values.items():
+            if group is not None:
+                data[group] = dict(group_values)
+        return data
+
+    def temperature(self, set_point_type, instruction, group=None):
+        """Return the temperature of an instruction, None if unknown."""
+        if set_point_type == "custom_temperature":
+            return instruction
+        if set_point_type == "defined_temperature":
+            temperatures = self.temperatures.get(group, self.temperatures[None])
+            return temperatures.get(instruction)
+        return None
+
+    def instruction(self, temperature, group=None):
+        """Return the named instruction set to temperature, or None."""
+        instructions = self.instructions.get(group, self.instructions[None])
+        return instructions.get(float(temperature))
+
+
+def _temperature_values(data):
+    return {
+        instruction: temperature
+        for instruction, temperature in data.items()
+        if isinstance(temperature, (int, float)) and not isinstance(temperature, bool)
+    }
@@ -0,0 +1,127 @@
+"""On-demand profiling of the refresh and entity fan-out pipeline."""
+
+import asyncio
+import cProfile
+from datetime import datetime
+import io
+import logging
+import pstats
+from time import monotonic
+
+from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+
+from .comap_functions import SNAPSHOT_ENDPOINTS
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds between two checks of the event loop lag.
+LOOP_LAG_INTERVAL = 0.05
+# Lag, in seconds, above which the loop is counted as blocked.
+LOOP_BLOCKED_THRESHOLD = 0.1
+# Number of functions listed in the text report.
+REPORT_FUNCTIONS = 40
+
+
+class LoopLagMonitor(object):
+    """Measure how late the event loop runs a periodic wake-up."""
+
+    def __init__(self):
+        self.samples = 0
+        self.max_lag = 0.0
+        self.blocked = 0
+        self.blocked_time = 0.0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        while True:
+            start = monotonic()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            lag = monotonic() - start - LOOP_LAG_INTERVAL
+            self.samples += 1
+            self.max_lag = max(self.max_lag, lag)
+            if lag > LOOP_BLOCKED_THRESHOLD:
+                self.blocked += 1
+                self.blocked_time += lag
+
+    def as_dict(self):
+        return {
+            "samples": self.samples,
+            "max_lag": self.max_lag,
+            "blocked": self.blocked,
+            "blocked_time": self.blocked_time,
+        }
+
+
+async def async_profile_refresh(
+    hass: HomeAssistant, coordinators, cycles, full_refresh=False
+):
+    """Profile cycles refreshes of every coordinator, then write a report.
+
+    cProfile sees everything running on the event loop meanwhile, not only
+    this integration. The pstats dump and a text report of the slowest
+    call paths are written to the config directory; their paths and a
+    summary are returned.
+    """
+    profiler = cProfile.Profile()
+    monitor = LoopLagMonitor()
+    durations = []
+    try:
+        profiler.enable()
+    except ValueError as err:
+        # Raised while another profile, of ours or not, is running.
+        raise HomeAssistantError(f"Cannot start profiling: {err}") from err
+    monitor.start()
+    try:
+        for _ in range(cycles):
+            if full_refresh:
+                for coordinator in coordinators:
+                    coordinator.invalidate(*SNAPSHOT_ENDPOINTS)
+            start = monotonic()
+            # Each cycle refreshes the housings concurrently, like the
+            # scheduled refreshes do.
+            await asyncio.gather(
+                *(coordinator.async_refresh() for coordinator in coordinators)
+            )
+            durations.append(monotonic() - start)
+    finally:
+        profiler.disable()
+        await monitor.stop()
+
+    name = "comapsmarthome_profile_" + datetime.now().strftime("%Y%m%d_%H%M%S")
+    stats_path = hass.config.path(name + ".prof")
+    report_path = hass.config.path(name + ".txt")
+    summary = {
+        "cycles": durations,
+        "loop_lag": monitor.as_dict(),
+        "stats_file": stats_path,
+        "report_file": report_path,
+    }
+    await hass.async_add_executor_job(
+        _write_report, profiler, stats_path, report_path, summary
+    )
+    _LOGGER.info("Comap refresh profile written to %s", report_path)
+    return summary
+
+
+def _write_report(profiler, stats_path, report_path, summary):
+    profiler.dump_stats(stats_path)
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_FUNCTIONS)
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(REPORT_FUNCTIONS)
+    stats.print_callers(REPORT_FUNCTIONS)
+    with open(report_path, "w", encoding="utf-8") as report:
+        report.write("Refresh cycles (seconds): %s\n" % summary["cycles"])
+        report.write("Event loop lag: %s\n\n" % summary["loop_lag"])
+        report.write(stream.getvalue())
@@ -1,5 +1,4 @@
-from datetime import timedelta, datetime
-from zoneinfo import ZoneInfo
+import asyncio
 
 import logging
 from typing import Any, Optional
@@ -8,22 +7,38 @@ import voluptuous as vol
 
 from homeassistant.components.sensor import PLATFORM_SCHEMA as SENSOR_PLATFORM_SCHEMA
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_PASSWORD, CONF_USERNAME, PERCENTAGE
-from homeassistant.core import HomeAssistant
+from homeassistant.const import (
+    ATTR_DEVICE_ID,
+    CONF_PASSWORD,
+    CONF_USERNAME,
+    PERCENTAGE,
+    EntityCategory,
+    UnitOfInformation,
+    UnitOfTime,
+)
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse
 from homeassistant.helpers import config_validation as cv
 from homeassistant.helpers.device_registry import DeviceInfo
-from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from homeassistant.helpers.typing import ConfigType
-from homeassistant.helpers.device_registry import DeviceInfo
 
-from .comap_functions import refresh_all_comap_entities, get_connected_object_zone_infos, get_now, setComapValues
+from .comap_functions import get_connected_object_zone_infos, get_now
 
 from .comap import ComapClient
+from .coordinator import (
+    ComapDataUpdateCoordinator,
+    all_coordinators,
+    target_coordinators,
+)
+from .entity import ComapEntity
+from .profiler import async_profile_refresh
 from .const import (
     ATTR_ADDRESS,
-    ATTR_AVL_SCHDL,
+    ATTR_CONFIG_ENTRY_ID,
     DOMAIN,
+    ATTR_CYCLES,
+    ATTR_FULL_REFRESH,
+    SERVICE_GET_API_METRICS,
+    SERVICE_PROFILE_REFRESH,
     SERVICE_SET_AWAY,
     SERVICE_SET_HOME,
 )
@@ -37,90 +52,162 @@ SENSOR_PLATFORM_SCHEMA = SENSOR_PLATFORM_SCHEMA.extend(
     }
 )
 
-SCAN_INTERVAL = timedelta(minutes=5)
-
+# Housings acted on by set_away and set_home.
+TARGET_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Optional(ATTR_DEVICE_ID): vol.All(cv.ensure_list, [cv.string]),
+            vol.Optional(ATTR_CONFIG_ENTRY_ID): vol.All(cv.ensure_list, [cv.string]),
+        }
+    ),
+    cv.has_at_least_one_key(ATTR_DEVICE_ID, ATTR_CONFIG_ENTRY_ID),
+)
 
 async def async_setup_entry(
     hass: HomeAssistant,
     config_entry: ConfigEntry,
     async_add_entities,
 ):
-    config = hass.data[DOMAIN][config_entry.entry_id]
-    await async_setup_platform(hass, config, async_add_entities)
+    entry_data = hass.data[DOMAIN][config_entry.entry_id]
+    client = entry_data["client"]
+    for coordinator in entry_data["coordinators"].values():
+        await async_setup_platform(hass, client, coordinator, async_add_entities)
+
+    if hass.services.has_service(DOMAIN, SERVICE_SET_AWAY):
+        return
+
+    def targeted(call):
+        return target_coordinators(
+            hass,
+            call.data.get(ATTR_DEVICE_ID, []),
+            call.data.get(ATTR_CONFIG_ENTRY_ID, []),
+        )
+
+    async def set_away(call):
+        """Set the targeted housings away."""
+        coordinators = targeted(call)
+        await asyncio.gather(
+            *(
+                coordinator.client.set_absence(coordinator.housing_id)
+                for coordinator in coordinators
+            )
+        )
+        await asyncio.gather(
+            *(
+                coordinator.async_refresh_endpoints("thermal_details")
+                for coordinator in coordinators
+            )
+        )
+
+    async def set_home(call):
+        """Bring the targeted housings back home."""
+        coordinators = targeted(call)
+        await asyncio.gather(
+            *(
+                coordinator.client.away_return(coordinator.housing_id)
+                for coordinator in coordinators
+            )
+        )
+        await asyncio.gather(
+            *(
+                coordinator.async_refresh_endpoints("thermal_details")
+                for coordinator in coordinators
+            )
+        )
+
+    async def get_api_metrics(call: ServiceCall):
+        """Return the Comap API metrics of every account."""
+        return {
+            entry_id: entry_data["client"].metrics.as_dict()
+            for entry_id, entry_data in hass.data[DOMAIN].items()
+        }
+
+    async def profile_refresh(call: ServiceCall):
+        """Profile the next refresh cycles of every housing."""
+        return await async_profile_refresh(
+            hass,
+            list(all_coordinators(hass)),
+            call.data[ATTR_CYCLES],
+            call.data[ATTR_FULL_REFRESH],
+        )
+
+    hass.services.async_register(
+        DOMAIN, SERVICE_SET_AWAY, set_away, schema=TARGET_SCHEMA
+    )
+    hass.services.async_register(
+        DOMAIN, SERVICE_SET_HOME, set_home, schema=TARGET_SCHEMA
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_GET_API_METRICS,
+        get_api_metrics,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_PROFILE_REFRESH,
+        profile_refresh,
+        schema=vol.Schema(
+            {
+                vol.Optional(ATTR_CYCLES, default=3): vol.All(
+                    vol.Coerce(int), vol.Range(min=1, max=20)
+                ),
+                vol.Optional(ATTR_FULL_REFRESH, default=False): cv.boolean,
+            }
+        ),
+        supports_response=SupportsResponse.OPTIONAL,
+    )
 
 
 async def async_setup_platform(
     hass: HomeAssistant,
-    config: ConfigType,
+    client: ComapClient,
+    coordinator: ComapDataUpdateCoordinator,
     async_add_entities: AddEntitiesCallback,
 ) -> None:
 
-    global _CLIENT
-    _CLIENT = ComapClient(username=config[CONF_USERNAME], password=config[CONF_PASSWORD])
-
-    global _HASS
-    _HASS = hass
-    
-    themal_details = hass.data[DOMAIN]["thermal_details"]
-    connected_objects = hass.data[DOMAIN]["connected_objects"]
-
-    zones = themal_details.get("zones")
-    obj_zone_names = {}
-    obj_zone_ids = {}
-    for zone in zones:
-        zone_obj = zone.get("connected_objects")
-        for obj_serial in zone_obj:
-            obj_zone_names[obj_serial] = zone.get("title")
-            obj_zone_ids[obj_serial] = zone.get("id")
+    connected_objects = coordinator.data["objects_by_serial"].values()
 
     batt_list = []
     for object in connected_objects:
-        if ('voltage_percent' in object):
+        if object.voltage_percent is not None:
             batt_list.append(object)
     
     batt_sensors = [
-        ComapBatterySensor(batt_sensor)
+        ComapBatterySensor(coordinator, batt_sensor)
         for batt_sensor in batt_list
     ]
 
     device_sensors = [
-        ComapDeviceSensor(device_sensor)
+        ComapDeviceSensor(coordinator, device_sensor)
         for device_sensor in connected_objects
     ]
 
 
-    housing_sensors = [ComapHousingSensor()]
+    housing_sensors = [ComapHousingSensor(coordinator)]
+    if coordinator.housing_id == client.housing:
+        # The metrics cover the whole account, show them on its first housing.
+        housing_sensors += [
+            ComapApiMetricSensor(coordinator, metric, label, unit)
+            for metric, (label, unit) in API_METRIC_SENSORS.items()
+        ]
 
     sensors = housing_sensors + device_sensors + batt_sensors
 
-    async_add_entities(sensors, update_before_add = True)
-
-    async def set_away(call):
-        """Set home away."""
-        await _CLIENT.leave_home()
-
-    async def set_home(call):
-        """Set home."""
-        await _CLIENT.return_home()
-
-    hass.services.async_register(DOMAIN, SERVICE_SET_AWAY, set_away)
-    hass.services.async_register(DOMAIN, SERVICE_SET_HOME, set_home)
+    async_add_entities(sensors)
 
     return True
 
 
-class ComapHousingSensor(Entity):
-    def __init__(self):
-        super().__init__()
-        self.hass = _HASS
-        self.client = _CLIENT
-        self.housing_id = _HASS.data[DOMAIN]["housing"].get("id")
-        self._name = "Infos " + _HASS.data[DOMAIN]["housing"].get("name")
-        self._state = self._state = _HASS.data[DOMAIN]["thermal_details"].get("services_available")
+class ComapHousingSensor(ComapEntity):
+    def __init__(self, coordinator):
+        super().__init__(coordinator)
+        self.housing_id = coordinator.housing_id
+        self._name = "Infos " + coordinator.data["housing_info"].name
         self._available = True
         self.attrs: dict[str, Any] = {}
         self._id = self.housing_id + "_sensor"
-        _HASS.data[DOMAIN]["main_sensor_id"] = self._id
+        self._update_from_data()
 
     @property
     def name(self) -> str:
@@ -135,7 +222,7 @@ class ComapHousingSensor(Entity):
     @property
     def available(self) -> bool:
         """Return True if entity is available."""
-        return self._available
+        return self._available and super().available
 
     @property
     def state(self) -> Optional[str]:
@@ -158,41 +245,116 @@ class ComapHousingSensor(Entity):
             serial_number = self.housing_id
         )
 
-    async def async_update(self):
-
-        await setComapValues(_HASS,_CLIENT)
-
-        housing = _HASS.data[DOMAIN]["housing"]
-        self._name = housing.get("name")
-        thermal_details = _HASS.data[DOMAIN]["thermal_details"]
+    def _update_from_data(self):
+        housing = self.coordinator.data["housing_info"]
+        self._name = housing.name
+        age = self.coordinator.snapshot_age
         self.attrs = {
             "automatic_update_value": get_now(),
             "automatic_update_label": "Mise à jour depuis comap : ",
-            ATTR_ADDRESS:  housing.get("address")
+            ATTR_ADDRESS:  housing.address,
+            "data_age": None if age is None else round(age),
+            "api_status": self.coordinator.client.circuit.state,
+            "last_error": self.coordinator.last_error,
         }
-        self._state = thermal_details.get("services_available")
-        await refresh_all_comap_entities(_HASS, self._id)
+        self._state = housing.services_available
                    
 
-class ComapBatterySensor(Entity):
-    def __init__(self, batt_sensor):
-        super().__init__()
+# Totals of the client metrics shown as sensors: key -> (label, unit).
+API_METRIC_SENSORS = {
+    "requests": ("API requests", None),
+    "errors": ("API errors", None),
+    "retries": ("API retries", None),
+    "latency_mean": ("API latency", UnitOfTime.MILLISECONDS),
+    "bytes": ("API data received", UnitOfInformation.BYTES),
+    "token_refreshes": ("API token refreshes", None),
+}
+
+
+class ComapApiMetricSensor(ComapEntity):
+    """Diagnostic sensor exposing one total of the client request metrics."""
+
+    def __init__(self, coordinator, metric, label, unit):
+        super().__init__(coordinator)
+        self.housing_id = coordinator.housing_id
+        self.metric = metric
+        self._name = label + " " + coordinator.data["housing_info"].name
+        self._unit = unit
+        self._id = self.housing_id + "_api_" + metric
+        self.attrs: dict[str, Any] = {}
+        self._update_from_data()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def unique_id(self) -> str:
+        return self._id
+
+    @property
+    def entity_category(self) -> EntityCategory:
+        return EntityCategory.DIAGNOSTIC
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def unit_of_measurement(self):
+        return self._unit
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        return self.attrs
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return the device info."""
+        return DeviceInfo(identifiers={(DOMAIN, self.housing_id)})
+
+    def _update_from_data(self):
+        metrics = self.coordinator.client.metrics
+        totals = metrics.totals()
+        value = totals[self.metric]
+        if self.metric == "latency_mean" and value is not None:
+            value = round(value * 1000)
+        self._state = value
+        if self.metric == "requests":
+            # Per endpoint breakdown, the full histograms are in the
+            # get_api_metrics service response.
+            self.attrs = {
+                name: {
+                    "count": endpoint.count,
+                    "statuses": dict(endpoint.statuses),
+                }
+                for name, endpoint in metrics.endpoints.items()
+            }
+        elif self.metric == "token_refreshes":
+            self.attrs = {"logins": totals["logins"]}
+
+
+class ComapBatterySensor(ComapEntity):
+    def __init__(self, coordinator, batt_sensor):
+        super().__init__(coordinator)
         """Initialize the battery sensor."""
-        self._state = batt_sensor.get("voltage_percent")
-        self.housing = _HASS.data[DOMAIN]["housing"].get("id")
-        self.sn = batt_sensor.get("serial_number")
-        self.model = batt_sensor.get("model")
-        self._batt = batt_sensor.get("voltage_percent")
-        obj_zone_infos = get_connected_object_zone_infos(self.sn, _HASS.data[DOMAIN]["thermal_details"])
+        self._state = batt_sensor.voltage_percent
+        self.housing = coordinator.housing_id
+        self.housing_name = coordinator.data["housing_info"].name
+        self.sn = batt_sensor.serial_number
+        self.model = batt_sensor.model
+        self._batt = batt_sensor.voltage_percent
+        obj_zone_infos = get_connected_object_zone_infos(self.sn, coordinator.data)
         self.zone_name = obj_zone_infos.get("title")
         if self.zone_name is None:
             self.zone_name = ""
-        self._name = "Batterie " + self.model + " " + self.zone_name + " " + _HASS.data[DOMAIN]["housing"].get("name")
+        self._name = "Batterie " + self.model + " " + self.zone_name + " " + self.housing_name
         self.zone_id = obj_zone_infos.get("id")
         if self.zone_id is None:
             self.zone_id = self.housing
         self._unique_id = self.housing + "_" + self.zone_id + "_battery_" + self.model + "_"+ self.sn
         self.attrs = {}
+        self._update_from_data()
 
     @property
     def name(self):
@@ -222,7 +384,7 @@ class ComapBatterySensor(Entity):
                 # Serial numbers are unique identifiers within a specific domain
                 (DOMAIN, self.zone_id)
             },
-            name = self.zone_name + " " + _HASS.data[DOMAIN]["housing"].get("name"),
+            name = self.zone_name + " " + self.housing_name,
             manufacturer = "comap",
             serial_number = self.zone_id
         )
@@ -235,12 +397,14 @@ class ComapBatterySensor(Entity):
     def unit_of_measurement(self):
         return PERCENTAGE
 
-    async def async_update(self):
+    def _data_changed(self) -> bool:
+        return self.coordinator.object_changed(self.sn)
+
+    def _update_from_data(self):
         batt = None
-        objects = _HASS.data[DOMAIN]["connected_objects"]
-        for object in objects:
-            if object.get("serial_number") == self.sn:
-                batt = object.get("voltage_percent")
+        object = self.coordinator.data["objects_by_serial"].get(self.sn)
+        if object is not None:
+            batt = object.voltage_percent
         self._state = batt
         self.attrs = {
             "automatic_update_value": get_now(),
@@ -248,17 +412,18 @@ class ComapBatterySensor(Entity):
         }
 
 
-class ComapDeviceSensor(Entity):
-    def __init__(self, device_sensor):
-        super().__init__()
-        self.housing = _HASS.data[DOMAIN]["housing"].get("id")
+class ComapDeviceSensor(ComapEntity):
+    def __init__(self, coordinator, device_sensor):
+        super().__init__(coordinator)
+        self.housing = coordinator.housing_id
+        self.housing_name = coordinator.data["housing_info"].name
         self._state = None
         self._available = True
-        self.sn = device_sensor.get("serial_number")
-        self.model = device_sensor.get("model")
+        self.sn = device_sensor.serial_number
+        self.model = device_sensor.model
         self.attrs: dict[str, Any] = {}
         self.device_sensor = device_sensor
-        obj_zone_infos = get_connected_object_zone_infos(self.sn, _HASS.data[DOMAIN]["thermal_details"])
+        obj_zone_infos = get_connected_object_zone_infos(self.sn, coordinator.data)
         self.zone_name = obj_zone_infos.get("title")
         if self.zone_name is None:
             self.zone_name = ""
@@ -268,6 +433,7 @@ class ComapDeviceSensor(Entity):
         if self.zone_id is None:
             self.zone_id = self.housing
         self._unique_id = self.housing + "_" + self.zone_id + "_" + self.model + "_"+ self.sn
+        self._update_from_data()
     
     @property
     def name(self) -> str:
@@ -294,7 +460,7 @@ class ComapDeviceSensor(Entity):
     @property
     def available(self) -> bool:
         """Return True if entity is available."""
-        return self._available
+        return self._available and super().available
 
     @property
     def state(self) -> Optional[str]:
@@ -312,18 +478,20 @@ class ComapDeviceSensor(Entity):
                 # Serial numbers are unique identifiers within a specific domain
                 (DOMAIN, self.zone_id)
             },
-            name = self.zone_name + " " + _HASS.data[DOMAIN]["housing"].get("name"),
+            name = self.zone_name + " " + self.housing_name,
             manufacturer = "comap",
             serial_number = self.zone_id
         )
 
-    async def async_update(self):
-        objects = _HASS.data[DOMAIN]["connected_objects"]
+    def _data_changed(self) -> bool:
+        return self.coordinator.object_changed(self.sn)
+
+    def _update_from_data(self):
+        object = self.coordinator.data["objects_by_serial"].get(self.sn)
         self.attrs = {
             "automatic_update_value": get_now(),
             "automatic_update_label": "Mise à jour depuis comap : ",
         }
-        for object in objects:
-            if object.get("serial_number") == self.sn:
-                self.attrs.update(object)
-                self._state = object.get("communication_status")
\ No newline at end of file
+        if object is not None:
+            self.attrs.update(object.attributes)
+            self._state = object.communication_status
\ No newline at end of file
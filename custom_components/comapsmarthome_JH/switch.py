@@ -1,20 +1,13 @@
-from datetime import timedelta
-import logging
 from typing import Any
 
 from homeassistant.components.switch import SwitchDeviceClass, SwitchEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.device_registry import DeviceInfo
-from homeassistant.helpers.entity_registry import async_get as async_get_entity_registry
 
-from .comap import ComapClient
 from .const import DOMAIN
-from .comap_functions import refresh_main_entity
-
-SCAN_INTERVAL = timedelta(minutes=60)
-_HASS = HomeAssistant
+from .comap_functions import get_zone_thermal_details
+from .entity import ComapEntity
 
 async def async_setup_entry(
     hass: HomeAssistant,
@@ -22,36 +15,39 @@ async def async_setup_entry(
     async_add_entities,
 ) -> None:
     
-    config = hass.data[DOMAIN][config_entry.entry_id]
-    client = ComapClient(username=config[CONF_USERNAME], password=config[CONF_PASSWORD])
-
-    global _HASS
-    _HASS = hass
-
-    zones = hass.data[DOMAIN]["thermal_details"].get("zones")
+    entry_data = hass.data[DOMAIN][config_entry.entry_id]
+    client = entry_data["client"]
+    switches = []
+    for coordinator in entry_data["coordinators"].values():
+        zones = coordinator.data["zones_by_id"].values()
 
-    temporary_instructions_switches = [
-        ComapZoneTemporarySwitch(client, zone)
-        for zone in zones
-    ]
+        temporary_instructions_switches = [
+            ComapZoneTemporarySwitch(coordinator, client, zone)
+            for zone in zones
+        ]
 
-    housing_switches = [ComapHousingOnOff(client),ComapHousingHoliday(client),ComapHousingAbsence(client)]
-    zones_switches = temporary_instructions_switches
+        housing_switches = [
+            ComapHousingOnOff(coordinator, client),
+            ComapHousingHoliday(coordinator, client),
+            ComapHousingAbsence(coordinator, client),
+        ]
+        zones_switches = temporary_instructions_switches
 
-    switches = housing_switches + zones_switches
+        switches += housing_switches + zones_switches
 
-    async_add_entities(switches, update_before_add=True)
+    async_add_entities(switches)
 
 
-class ComapHousingOnOff(SwitchEntity):
-    def __init__(self, client) -> None:
-        super().__init__()
+class ComapHousingOnOff(ComapEntity, SwitchEntity):
+    def __init__(self, coordinator, client) -> None:
+        super().__init__(coordinator)
         self.client = client
-        self.housing = _HASS.data[DOMAIN]["housing"].get("id")
-        self._name = _HASS.data[DOMAIN]["housing"].get("name")
+        self.housing = coordinator.housing_id
+        self.housing_name = coordinator.data["housing_info"].name
+        self._name = self.housing_name
         self._is_on = None
         self._attr_device_class = SwitchDeviceClass.SWITCH
-        self.hass = _HASS
+        self._update_from_data()
         self._id = self.housing + "_on_off"
 
     @property
@@ -60,9 +56,9 @@ class ComapHousingOnOff(SwitchEntity):
         return DeviceInfo(
             identifiers={
                 # Serial numbers are unique identifiers within a specific domain
-                (DOMAIN, _HASS.data[DOMAIN]["housing"].get("id"))
+                (DOMAIN, self.housing)
             },
-            name=_HASS.data[DOMAIN]["housing"].get("name"),
+            name=self.housing_name,
             manufacturer="comap",
         )
 
@@ -81,30 +77,34 @@ class ComapHousingOnOff(SwitchEntity):
         """If the sensor is currently on or off."""
         return self._is_on
     
-    async def async_update(self):
-        zones = _HASS.data[DOMAIN]["thermal_details"]
-        self._is_on = zones["heating_system_state"] == "on"
+    def _data_changed(self) -> bool:
+        return self.coordinator.housing_changed
+
+    def _update_from_data(self):
+        housing = self.coordinator.data["housing_info"]
+        self._is_on = housing.heating_system_state == "on"
 
     async def async_turn_on(self, **kwargs: Any) -> None:
-        ret = await self.client.turn_on()
-        await refresh_main_entity(_HASS)
+        ret = await self.client.turn_on(housing=self.coordinator.housing_id)
+        await self.coordinator.async_set_heating_system_state("on")
         return ret
 
     async def async_turn_off(self, **kwargs: Any) -> None:
-        ret =  await self.client.turn_off()
-        await refresh_main_entity(_HASS)
+        ret =  await self.client.turn_off(housing=self.coordinator.housing_id)
+        await self.coordinator.async_set_heating_system_state("off")
         return ret
     
-class ComapHousingHoliday(SwitchEntity):
-    def __init__(self, client) -> None:
-        super().__init__()
+class ComapHousingHoliday(ComapEntity, SwitchEntity):
+    def __init__(self, coordinator, client) -> None:
+        super().__init__(coordinator)
         self.client = client
-        self.housing = _HASS.data[DOMAIN]["housing"].get("id")
-        self._name = "Holiday " + _HASS.data[DOMAIN]["housing"].get("name")
+        self.housing = coordinator.housing_id
+        self.housing_name = coordinator.data["housing_info"].name
+        self._name = "Holiday " + self.housing_name
         self._is_on = None
         self._attr_device_class = SwitchDeviceClass.SWITCH
         self._extra_state_attributes = {}
-        self.hass = _HASS
+        self._update_from_data()
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -112,9 +112,9 @@ class ComapHousingHoliday(SwitchEntity):
         return DeviceInfo(
             identifiers={
                 # Serial numbers are unique identifiers within a specific domain
-                (DOMAIN, _HASS.data[DOMAIN]["housing"].get("id"))
+                (DOMAIN, self.housing)
             },
-            name=_HASS.data[DOMAIN]["housing"].get("name"),
+            name=self.housing_name,
             manufacturer="comap",
         )
 
@@ -137,35 +137,35 @@ class ComapHousingHoliday(SwitchEntity):
     def extra_state_attributes(self):
         return self._extra_state_attributes
 
-    async def async_update(self):
-        thermal_details = _HASS.data[DOMAIN]["thermal_details"]
-        events = thermal_details.get("events")
-        if ('absence' in events):
-            self._is_on = True
-        else:
-            self._is_on = False
-        self._extra_state_attributes = events.get("absence")
+    def _data_changed(self) -> bool:
+        return self.coordinator.housing_changed
+
+    def _update_from_data(self):
+        absence = self.coordinator.data["housing_info"].absence
+        self._is_on = absence is not None
+        self._extra_state_attributes = None if absence is None else dict(absence)
        
     async def async_turn_on(self, **kwargs: Any) -> None:
         self._is_on = True
-        await self.client.set_holiday()
-        await refresh_main_entity(_HASS)
+        await self.client.set_holiday(housing=self.coordinator.housing_id)
+        await self.coordinator.async_refresh_endpoints("thermal_details")
 
     async def async_turn_off(self, **kwargs: Any) -> None:
         self._is_on = False
-        await self.client.delete_holiday()
-        await refresh_main_entity(_HASS)
+        await self.client.delete_holiday(housing=self.coordinator.housing_id)
+        await self.coordinator.async_refresh_endpoints("thermal_details")
     
-class ComapHousingAbsence(SwitchEntity):
-    def __init__(self, client) -> None:
-        super().__init__()
+class ComapHousingAbsence(ComapEntity, SwitchEntity):
+    def __init__(self, coordinator, client) -> None:
+        super().__init__(coordinator)
         self.client = client
-        self.housing = _HASS.data[DOMAIN]["housing"].get("id")
-        self._name = "Absence " + _HASS.data[DOMAIN]["housing"].get("name")
+        self.housing = coordinator.housing_id
+        self.housing_name = coordinator.data["housing_info"].name
+        self._name = "Absence " + self.housing_name
         self._is_on = None
         self._attr_device_class = SwitchDeviceClass.SWITCH
         self._extra_state_attributes = {}
-        self.hass = _HASS
+        self._update_from_data()
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -173,9 +173,9 @@ class ComapHousingAbsence(SwitchEntity):
         return DeviceInfo(
             identifiers={
                 # Serial numbers are unique identifiers within a specific domain
-                (DOMAIN, _HASS.data[DOMAIN]["housing"].get("id"))
+                (DOMAIN, self.housing)
             },
-            name=_HASS.data[DOMAIN]["housing"].get("name"),
+            name=self.housing_name,
             manufacturer="comap",
         )
 
@@ -198,39 +198,39 @@ class ComapHousingAbsence(SwitchEntity):
     def extra_state_attributes(self):
         return self._extra_state_attributes
 
-    async def async_update(self):
-        thermal_details = _HASS.data[DOMAIN]["thermal_details"]
-        events = thermal_details.get("events")
-        if ('time_shift' in events):
-            self._is_on = True
-        else:
-            self._is_on = False
-        self._extra_state_attributes = events.get("time_shift")
+    def _data_changed(self) -> bool:
+        return self.coordinator.housing_changed
+
+    def _update_from_data(self):
+        time_shift = self.coordinator.data["housing_info"].time_shift
+        self._is_on = time_shift is not None
+        self._extra_state_attributes = None if time_shift is None else dict(time_shift)
        
     async def async_turn_on(self, **kwargs: Any) -> None:
         self._is_on = True
-        await self.client.set_absence()
-        await refresh_main_entity(_HASS)
+        await self.client.set_absence(housing=self.coordinator.housing_id)
+        await self.coordinator.async_refresh_endpoints("thermal_details")
 
     async def async_turn_off(self, **kwargs: Any) -> None:
         self._is_on = True
-        await self.client.delete_absence()
-        await refresh_main_entity(_HASS)
+        await self.client.delete_absence(housing=self.coordinator.housing_id)
+        await self.coordinator.async_refresh_endpoints("thermal_details")
     
 
-class ComapZoneTemporarySwitch(SwitchEntity):
-    def __init__(self, client, zone) -> None:
-        super().__init__()
+class ComapZoneTemporarySwitch(ComapEntity, SwitchEntity):
+    def __init__(self, coordinator, client, zone) -> None:
+        super().__init__(coordinator)
         self.client = client
-        self.housing = _HASS.data[DOMAIN]["housing"].get("id")
-        self._name = "Temporary " + _HASS.data[DOMAIN]["housing"].get("name") + " " + zone.get("title")
-        self._id = zone.get("id") + "_temporary"
-        self.zone_name = zone.get("title")
-        self.zone_id = zone.get("id")
+        self.housing = coordinator.housing_id
+        self.housing_name = coordinator.data["housing_info"].name
+        self._name = "Temporary " + self.housing_name + " " + zone.title
+        self._id = zone.id + "_temporary"
+        self.zone_name = zone.title
+        self.zone_id = zone.id
         self._extra_state_attributes = {}
         self._is_on = False
         self._extra_state_attributes = {}
-        self.hass = _HASS
+        self._update_from_data()
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -275,21 +275,22 @@ class ComapZoneTemporarySwitch(SwitchEntity):
         """If the sensor is currently on or off."""
         return self._is_on
 
-    async def async_update(self):
+    def _data_changed(self) -> bool:
+        return self.coordinator.zone_changed(self.zone_id)
+
+    def _update_from_data(self):
         self._extra_state_attributes = {}
-        thermal_details = _HASS.data[DOMAIN]["thermal_details"]
-        zones = thermal_details.get("zones")
-        events = {}
-        for zone in zones:
-            if zone.get("id") == self.zone_id:
-                events = zone.get("events")
-        self._extra_state_attributes["temporary_instruction"] = events.get("temporary_instruction")
-        if ('temporary_instruction' in events):
-            temporary_instruction = events.get("temporary_instruction")
+        temporary_instruction = None
+        zone = get_zone_thermal_details(self.zone_id, self.coordinator.data)
+        if zone is not None:
+            temporary_instruction = zone.temporary_instruction
+        if temporary_instruction is not None:
             self._is_on = True
-            self._extra_state_attributes["end_at"] = temporary_instruction.get("end_at")
-            self._extra_state_attributes["instruction"] = temporary_instruction.get("set_point").get("instruction")
+            self._extra_state_attributes["temporary_instruction"] = dict(temporary_instruction.raw)
+            self._extra_state_attributes["end_at"] = temporary_instruction.end_at
+            self._extra_state_attributes["instruction"] = temporary_instruction.instruction
         else:
+            self._extra_state_attributes["temporary_instruction"] = None
             self._is_on = False
             self._extra_state_attributes["end_at"] = None
             self._extra_state_attributes["instruction"] = None
@@ -298,11 +299,7 @@ class ComapZoneTemporarySwitch(SwitchEntity):
         return
     
     async def async_turn_off(self, **kwargs: Any) -> None:
-        response = await self.client.remove_temporary_instruction(self.zone_id)
-        events = response.get("events")
-        self._extra_state_attributes["temporary_instruction"] = events.get("temporary_instruction")
-        if ('temporary_instruction' in events):
-            self._is_on = True
-        else:
-            self._is_on = False
-        await refresh_main_entity(_HASS)
\ No newline at end of file
+        response = await self.client.remove_temporary_instruction(
+            self.zone_id, housing=self.coordinator.housing_id
+        )
+        await self.coordinator.async_apply_zone_response(self.zone_id, response)
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""Benchmark a cold start against a warm start from the saved snapshot.
+
+For each housing size, against the local stand-in:
+
+- cold: log in, discover the housings and fetch every endpoint, as the
+  first setup of an entry does,
+- warm: load the snapshot and tokens saved by the cold start and restore
+  the coordinator from them, as the setup of an entry with a cache does.
+
+Reports, per start, the wall time until the entities could be built and
+the API requests issued, and the size of the saved snapshot.
+
+Needs Home Assistant, httpx and aiohttp, as in a development environment
+of the integration. Run from the repository root:
+
+    python scripts/benchmark_startup.py --zones 1 10 100 500 --latency 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from statistics import median
+import sys
+import tempfile
+from time import perf_counter
+
+from homeassistant.core import HomeAssistant
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from comap_standin import StandinOptions, start_standin  # noqa: E402
+from custom_components.comapsmarthome_JH.comap import ComapClient  # noqa: E402
+from custom_components.comapsmarthome_JH.comap_functions import (  # noqa: E402
+    SNAPSHOT_ENDPOINTS,
+)
+from custom_components.comapsmarthome_JH.coordinator import (  # noqa: E402
+    ComapDataUpdateCoordinator,
+    ComapSnapshotStore,
+)
+
+ENTRY_ID = "benchmark"
+
+
+async def cold_start(hass, base_url, auth_url):
+    client = ComapClient("benchmark", "benchmark", base_url=base_url, auth_url=auth_url)
+    await client.async_setup()
+    coordinators = [
+        ComapDataUpdateCoordinator(hass, client, housing_id)
+        for housing_id in client.housings
+    ]
+    for coordinator in coordinators:
+        coordinator.data = await coordinator._async_fetch(set(SNAPSHOT_ENDPOINTS))
+    return client, coordinators
+
+
+async def warm_start(hass, base_url, auth_url, tokens):
+    client = ComapClient("benchmark", "benchmark", base_url=base_url, auth_url=auth_url)
+    client.restore_tokens(tokens)
+    cached = await ComapSnapshotStore(hass, ENTRY_ID).async_load()
+    coordinators = []
+    for housing in cached:
+        coordinator = ComapDataUpdateCoordinator(hass, client, housing["housing_id"])
+        coordinator.async_restore(housing)
+        coordinators.append(coordinator)
+    return client, coordinators
+
+
+async def benchmark(zones, rounds, latency):
+    runner, base_url, auth_url = await start_standin(
+        StandinOptions(zones=zones, latency=latency, jitter=0, seed=zones)
+    )
+    state = runner.app["state"]
+    results = {"cold": [], "warm": []}
+    size = None
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = HomeAssistant(config_dir)
+        try:
+            for _ in range(rounds):
+                state.stats.clear()
+                start = perf_counter()
+                client, coordinators = await cold_start(hass, base_url, auth_url)
+                results["cold"].append(
+                    (perf_counter() - start, sum(state.stats.values()))
+                )
+                tokens = client.export_tokens()
+                store = ComapSnapshotStore(hass, ENTRY_ID)
+                store.coordinators = coordinators
+                data = store.data_to_save()
+                await store._store.async_save(data)
+                size = len(json.dumps(data))
+                await client.close()
+
+                state.stats.clear()
+                start = perf_counter()
+                client, coordinators = await warm_start(
+                    hass, base_url, auth_url, tokens
+                )
+                results["warm"].append(
+                    (perf_counter() - start, sum(state.stats.values()))
+                )
+                await client.close()
+        finally:
+            await runner.cleanup()
+            await hass.async_stop(force=True)
+    return results, size
+
+
+def report(zones, results, size):
+    print(
+        "%5d zones | cold %8.2f ms %3d requests | warm %8.2f ms %3d requests | "
+        "snapshot %8.1f KiB"
+        % (
+            zones,
+            median(duration for duration, _ in results["cold"]) * 1000,
+            median(requests for _, requests in results["cold"]),
+            median(duration for duration, _ in results["warm"]) * 1000,
+            median(requests for _, requests in results["warm"]),
+            size / 1024,
+        )
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--zones", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument(
+        "--latency", type=float, default=0.1, help="stand-in latency in seconds"
+    )
+    args = parser.parse_args()
+    for zones in args.zones:
+        results, size = await benchmark(zones, args.rounds, args.latency)
+        report(zones, results, size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,458 @@
+"""Local stand-in for the Comap API and its Cognito login, for offline work.
+
+Serves generated housings over the endpoints used by ComapClient, with
+configurable latency, error rates and 409/429 responses. Point a client at
+it with:
+
+    ComapClient(
+        username, password,
+        base_url="http://127.0.0.1:8080/api/",
+        auth_url="http://127.0.0.1:8080/cognito",
+    )
+
+Run with ``python scripts/comap_standin.py --help``. Any username is
+accepted, with the password of its first login, and gets its own housings,
+created on that login. Request counts per route are served on
+``/_standin/stats`` and reset by a DELETE on the same URL.
+"""
+
+import argparse
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import json
+import random
+import secrets
+
+from aiohttp import web
+
+INSTRUCTIONS = ["stop", "frost_protection", "eco", "comfort_minus2", "comfort_minus1", "comfort"]
+
+
+class StandinOptions(object):
+    """Behaviour of the stand-in API."""
+
+    def __init__(
+        self,
+        housings=1,
+        zones=4,
+        latency=0.05,
+        jitter=0.02,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        retry_after=1,
+        conflict_rate=0.0,
+        auth_error_rate=0.0,
+        token_lifetime=3600,
+        seed=None,
+    ):
+        # Housings of each account.
+        self.housings = housings
+        self.zones = zones
+        # Seconds added to every response, plus up to jitter seconds.
+        self.latency = latency
+        self.jitter = jitter
+        # Share of API requests answered with a 503, or a 429 with a
+        # Retry-After of retry_after seconds.
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        # Share of temporary instruction writes answered with a 409 even if
+        # the zone has no temporary instruction yet.
+        self.conflict_rate = conflict_rate
+        # Share of Cognito requests answered with a 503.
+        self.auth_error_rate = auth_error_rate
+        self.token_lifetime = token_lifetime
+        self.seed = seed
+
+
+def _iso(moment):
+    return moment.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class StandinState(object):
+    """In-memory housings, tokens and request counters of the stand-in."""
+
+    def __init__(self, options):
+        self.options = options
+        self.random = random.Random(options.seed)
+        # Token -> username.
+        self.access_tokens = {}
+        self.refresh_tokens = {}
+        self.stats = Counter()
+        # API requests being answered, and the most there ever were.
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Username -> password set by its first login.
+        self.passwords = {}
+        # Username -> ids of its housings.
+        self.accounts = {}
+        self.housings = {}
+
+    def account(self, username):
+        """Return the housing ids of an account, creating them if needed."""
+        if username not in self.accounts:
+            self.accounts[username] = []
+            for _ in range(self.options.housings):
+                self.add_housing(username)
+        return self.accounts[username]
+
+    def add_housing(self, username):
+        """Add a housing to the account of username, return its id."""
+        index = len(self.housings)
+        housing_id = "housing-%d" % index
+        self.housings[housing_id] = self._make_housing(housing_id, index)
+        self.accounts.setdefault(username, []).append(housing_id)
+        return housing_id
+
+    def _make_housing(self, housing_id, index):
+        now = datetime.now(timezone.utc)
+        zones = []
+        objects = []
+        for zone_index in range(self.options.zones):
+            zone_id = "%s-zone-%d" % (housing_id, zone_index)
+            thermostat = "%s-th-%d" % (housing_id, zone_index)
+            pilot_wire = zone_index % 2 == 1
+            instruction = self.random.choice(INSTRUCTIONS[2:]) if pilot_wire else "comfort"
+            zones.append(
+                {
+                    "id": zone_id,
+                    "title": "Zone %d" % zone_index,
+                    "set_point_type": "pilot_wire" if pilot_wire else "defined_temperature",
+                    "set_point": {"instruction": instruction},
+                    "temperature": round(self.random.uniform(17, 22), 1),
+                    "humidity": self.random.randint(35, 60),
+                    "heating_status": "heating",
+                    "last_presence_detected": _iso(now - timedelta(minutes=zone_index)),
+                    "next_timeslot": {
+                        "begin_at": _iso(now + timedelta(hours=1)),
+                        "set_point": {"instruction": "eco"},
+                    },
+                    "connected_objects": [thermostat],
+                    "events": {},
+                }
+            )
+            objects.append(
+                {
+                    "serial_number": thermostat,
+                    "model": "thermostat",
+                    "voltage_percent": self.random.randint(20, 100),
+                    "voltage_status": "ok",
+                    "communication_status": "available",
+                    "last_communication_time": _iso(now),
+                    "zone_ids": [zone_id],
+                }
+            )
+        schedules = [
+            {"id": "%s-schedule-%d" % (housing_id, i), "title": "Schedule %d" % i}
+            for i in range(3)
+        ]
+        programs = [
+            {
+                "id": "%s-program-%d" % (housing_id, i),
+                "title": "Program %d" % i,
+                "is_activated": i == 0,
+                "zones": [
+                    {
+                        "id": zone["id"],
+                        "schedule_id": schedules[0]["id"],
+                        # Every other thermostat zone follows the smart group.
+                        "programming_type": (
+                            "smart" if zone_index % 4 == 2 else "connected"
+                        ),
+                    }
+                    for zone_index, zone in enumerate(zones)
+                ],
+            }
+            for i in range(2)
+        ]
+        return {
+            "housing": {
+                "id": housing_id,
+                "name": "Housing %d" % index,
+                "address": "%d rue de la Paix, Paris" % (index + 1),
+            },
+            "thermal_details": {
+                "heating_system_state": "on",
+                "services_available": True,
+                "events": {},
+                "zones": zones,
+            },
+            "connected_objects": objects,
+            "schedules": schedules,
+            "programs": {"programs": programs},
+            "temperatures": {
+                "connected": {"comfort": 19.5, "comfort_minus1": 18.5, "comfort_minus2": 17.5, "eco": 16, "frost_protection": 7},
+                "smart": {"comfort": 19, "eco": 16},
+            },
+        }
+
+    def issue_tokens(self, username, refresh=True):
+        self.account(username)
+        access_token = secrets.token_urlsafe(24)
+        self.access_tokens[access_token] = username
+        result = {
+            "AccessToken": access_token,
+            "ExpiresIn": self.options.token_lifetime,
+            "TokenType": "Bearer",
+        }
+        if refresh:
+            refresh_token = secrets.token_urlsafe(32)
+            self.refresh_tokens[refresh_token] = username
+            result["RefreshToken"] = refresh_token
+        return {"AuthenticationResult": result}
+
+    def housing(self, request):
+        housing_id = request.match_info["housing"]
+        if housing_id not in self.accounts[request["username"]]:
+            raise web.HTTPNotFound()
+        return self.housings[housing_id]
+
+    def zone(self, request):
+        zone_id = request.match_info["zone"]
+        for zone in self.housing(request)["thermal_details"]["zones"]:
+            if zone["id"] == zone_id:
+                return zone
+        raise web.HTTPNotFound()
+
+
+@web.middleware
+async def standin_middleware(request, handler):
+    state = request.app["state"]
+    options = state.options
+    route = request.match_info.route.resource
+    name = route.canonical if route is not None else request.path
+    state.stats[request.method + " " + name] += 1
+    if not request.path.startswith("/api/"):
+        await asyncio.sleep(options.latency + state.random.uniform(0, options.jitter))
+        return await handler(request)
+    state.in_flight += 1
+    state.max_in_flight = max(state.max_in_flight, state.in_flight)
+    try:
+        await asyncio.sleep(options.latency + state.random.uniform(0, options.jitter))
+        return await _api_request(state, request, handler)
+    finally:
+        state.in_flight -= 1
+
+
+async def _api_request(state, request, handler):
+    options = state.options
+    authorization = request.headers.get("Authorization", "")
+    username = state.access_tokens.get(authorization.removeprefix("Bearer "))
+    if username is None:
+        return web.json_response({"message": "Unauthorized"}, status=401)
+    request["username"] = username
+    if state.random.random() < options.throttle_rate:
+        return web.json_response(
+            {"message": "Too Many Requests"},
+            status=429,
+            headers={"Retry-After": str(options.retry_after)},
+        )
+    if state.random.random() < options.error_rate:
+        return web.json_response({"message": "Service Unavailable"}, status=503)
+    return await handler(request)
+
+
+async def cognito(request):
+    state = request.app["state"]
+    auth_error_rate = state.options.auth_error_rate
+    if auth_error_rate and state.random.random() < auth_error_rate:
+        return web.json_response({"message": "Service Unavailable"}, status=503)
+    # Cognito requests are sent as application/x-amz-json-1.1.
+    payload = json.loads(await request.text())
+    flow = payload.get("AuthFlow")
+    parameters = payload.get("AuthParameters", {})
+    username = parameters.get("USERNAME")
+    if flow == "USER_PASSWORD_AUTH" and username:
+        password = state.passwords.setdefault(username, parameters.get("PASSWORD"))
+        if parameters.get("PASSWORD") == password:
+            return web.json_response(state.issue_tokens(username))
+    username = state.refresh_tokens.get(parameters.get("REFRESH_TOKEN"))
+    if flow == "REFRESH_TOKEN_AUTH" and username is not None:
+        return web.json_response(state.issue_tokens(username, refresh=False))
+    return web.json_response(
+        {"__type": "NotAuthorizedException", "message": "Incorrect username or password."},
+        status=400,
+    )
+
+
+async def get_housings(request):
+    state = request.app["state"]
+    housing_ids = state.account(request["username"])
+    return web.json_response(
+        [state.housings[housing_id]["housing"] for housing_id in housing_ids]
+    )
+
+
+def _getter(key):
+    async def handler(request):
+        return web.json_response(request.app["state"].housing(request)[key])
+
+    return handler
+
+
+async def get_zone(request):
+    return web.json_response(request.app["state"].zone(request))
+
+
+async def set_temporary_instruction(request):
+    state = request.app["state"]
+    zone = state.zone(request)
+    if "temporary_instruction" in zone["events"] or (
+        state.random.random() < state.options.conflict_rate
+    ):
+        return web.json_response({"message": "Conflict"}, status=409)
+    payload = await request.json()
+    end_at = datetime.now(timezone.utc) + timedelta(minutes=payload.get("duration", 120))
+    zone["events"]["temporary_instruction"] = {
+        "set_point": payload["set_point"],
+        "end_at": _iso(end_at),
+    }
+    zone["set_point"] = dict(payload["set_point"])
+    return web.json_response(zone)
+
+
+async def remove_temporary_instruction(request):
+    zone = request.app["state"].zone(request)
+    zone["events"].pop("temporary_instruction", None)
+    return web.json_response(zone)
+
+
+def _housing_event(name, active):
+    async def handler(request):
+        events = request.app["state"].housing(request)["thermal_details"]["events"]
+        if active:
+            events[name] = {"begin_at": _iso(datetime.now(timezone.utc))}
+        else:
+            events.pop(name, None)
+        return web.json_response({})
+
+    return handler
+
+
+async def set_heating_system_state(request):
+    payload = await request.json()
+    housing = request.app["state"].housing(request)
+    housing["thermal_details"]["heating_system_state"] = payload["state"]
+    return web.json_response({"heating_system_state": payload["state"]})
+
+
+async def activate_program(request):
+    programs = request.app["state"].housing(request)["programs"]["programs"]
+    program_id = request.match_info["program"]
+    if program_id not in [program["id"] for program in programs]:
+        raise web.HTTPNotFound()
+    for program in programs:
+        program["is_activated"] = program["id"] == program_id
+    return web.json_response({})
+
+
+async def set_zone_schedule(request):
+    payload = await request.json()
+    programs = request.app["state"].housing(request)["programs"]["programs"]
+    for program in programs:
+        if program["id"] == request.match_info["program"]:
+            for zone in program["zones"]:
+                if zone["id"] == request.match_info["zone"]:
+                    zone["schedule_id"] = payload["schedule_id"]
+                    zone["programming_type"] = payload.get(
+                        "programming_type", zone["programming_type"]
+                    )
+            return web.json_response({})
+    raise web.HTTPNotFound()
+
+
+async def get_stats(request):
+    return web.json_response(dict(request.app["state"].stats))
+
+
+async def reset_stats(request):
+    request.app["state"].stats.clear()
+    return web.json_response({})
+
+
+def make_app(options):
+    """Build the aiohttp application serving the stand-in API."""
+    app = web.Application(middlewares=[standin_middleware])
+    app["state"] = StandinState(options)
+    housing = "/api/park/housings/{housing}"
+    thermal = "/api/thermal/housings/{housing}"
+    control = thermal + "/thermal-control"
+    app.add_routes(
+        [
+            web.post("/cognito", cognito),
+            web.get("/api/park/housings", get_housings),
+            web.get(housing + "/connected-objects", _getter("connected_objects")),
+            web.get(thermal + "/thermal-details", _getter("thermal_details")),
+            web.get(thermal + "/thermal-details/zones/{zone}", get_zone),
+            web.get(thermal + "/schedules", _getter("schedules")),
+            web.get(thermal + "/programs", _getter("programs")),
+            web.get(thermal + "/custom-temperatures", _getter("temperatures")),
+            web.post(thermal + "/programs/{program}/activate", activate_program),
+            web.post(thermal + "/programs/{program}/zones/{zone}", set_zone_schedule),
+            web.post(control + "/zones/{zone}/temporary-instruction", set_temporary_instruction),
+            web.delete(control + "/zones/{zone}/temporary-instruction", remove_temporary_instruction),
+            web.post(control + "/absence", _housing_event("absence", True)),
+            web.delete(control + "/absence", _housing_event("absence", False)),
+            web.post(control + "/leave-home", _housing_event("time_shift", True)),
+            web.delete(control + "/leave-home", _housing_event("time_shift", False)),
+            web.post(control + "/come-back-home", _housing_event("time_shift", False)),
+            web.put(control + "/heating-system-state", set_heating_system_state),
+            web.get("/_standin/stats", get_stats),
+            web.delete("/_standin/stats", reset_stats),
+        ]
+    )
+    return app
+
+
+async def start_standin(options, host="127.0.0.1", port=0):
+    """Serve the stand-in in the running loop.
+
+    Returns the runner, to clean up when done, and the base and auth URLs
+    to give to ComapClient.
+    """
+    runner = web.AppRunner(make_app(options))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    root = "http://%s:%d" % (host, port)
+    return runner, root + "/api/", root + "/cognito"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--housings", type=int, default=1)
+    parser.add_argument("--zones", type=int, default=4, help="zones per housing")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503s")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of 429s")
+    parser.add_argument("--retry-after", type=int, default=1, help="seconds")
+    parser.add_argument("--conflict-rate", type=float, default=0.0, help="share of 409s")
+    parser.add_argument(
+        "--auth-error-rate", type=float, default=0.0, help="share of Cognito 503s"
+    )
+    parser.add_argument("--token-lifetime", type=int, default=3600, help="seconds")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    options = StandinOptions(
+        housings=args.housings,
+        zones=args.zones,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        conflict_rate=args.conflict_rate,
+        auth_error_rate=args.auth_error_rate,
+        token_lifetime=args.token_lifetime,
+        seed=args.seed,
+    )
+    web.run_app(make_app(options), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""Tests of the ComapSmartHome integration."""
+
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+
+from custom_components.comapsmarthome_JH.const import DOMAIN
+
+
+def mock_config_entry(hass, username="user@example.com"):
+    """Add an entry of the account username to hass."""
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        title=username,
+        data={CONF_USERNAME: username, CONF_PASSWORD: "password"},
+    )
+    entry.add_to_hass(hass)
+    return entry
+
+
+async def async_setup_accounts(hass, *usernames):
+    """Set up one entry per account, return the entries."""
+    entries = []
+    for username in usernames:
+        entry = mock_config_entry(hass, username)
+        assert await hass.config_entries.async_setup(entry.entry_id)
+        await hass.async_block_till_done()
+        entries.append(entry)
+    return entries
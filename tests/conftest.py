@@ -0,0 +1,83 @@
+"""Fixtures of the ComapSmartHome tests.
+
+The tests run against scripts/comap_standin.py served in the test loop.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from comap_standin import StandinOptions, start_standin
+from custom_components.comapsmarthome_JH import comap
+from custom_components.comapsmarthome_JH.comap import ComapClient
+
+
+@pytest.fixture(autouse=True)
+def auto_enable_custom_integrations(enable_custom_integrations):
+    """Let Home Assistant load the integration from custom_components."""
+    yield
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    """Retry failed requests without waiting."""
+    monkeypatch.setattr(comap, "RETRY_BACKOFF", 0)
+
+
+@pytest.fixture
+def standin_options():
+    """Options of the stand-in, overridden by the tests needing others."""
+    return StandinOptions(latency=0, jitter=0, seed=1)
+
+
+@pytest.fixture
+async def standin(socket_enabled, standin_options):
+    """Serve the stand-in API on localhost, yield its state and URLs."""
+    runner, base_url, auth_url = await start_standin(standin_options)
+    yield SimpleNamespace(
+        state=runner.app["state"], base_url=base_url, auth_url=auth_url
+    )
+    await runner.cleanup()
+
+
+@pytest.fixture
+async def comap_client(standin):
+    """Client of the stand-in, closed at the end of the test."""
+    client = ComapClient(
+        "user@example.com",
+        "password",
+        base_url=standin.base_url,
+        auth_url=standin.auth_url,
+    )
+    yield client
+    await client.close()
+
+
+@pytest.fixture
+def comap_api(standin, monkeypatch):
+    """Point the clients built by the integration at the stand-in."""
+    monkeypatch.setattr(ComapClient, "_BASEURL", standin.base_url)
+    monkeypatch.setattr(ComapClient, "_AUTHURL", standin.auth_url)
+    return standin
+
+
+@pytest.fixture
+def benchmark_loop(socket_enabled):
+    """Event loop the benchmarks run step by step, pytest-benchmark being sync."""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(loop.shutdown_default_executor())
+    loop.close()
+
+
+@pytest.fixture
+def benchmark_standin(benchmark_loop, standin_options):
+    """Serve the stand-in API in the benchmark loop, yield its state and URLs."""
+    runner, base_url, auth_url = benchmark_loop.run_until_complete(
+        start_standin(standin_options)
+    )
+    yield SimpleNamespace(
+        state=runner.app["state"], base_url=base_url, auth_url=auth_url
+    )
+    benchmark_loop.run_until_complete(runner.cleanup())
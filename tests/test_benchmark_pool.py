@@ -0,0 +1,42 @@
+"""Benchmark of a request sent over the pool against a fresh HTTP client.
+
+Run alone with ``pytest tests/test_benchmark_pool.py``, pytest-benchmark
+reports both variants side by side.
+"""
+
+import pytest
+
+from custom_components.comapsmarthome_JH.comap import ComapClient, TokenBucket
+
+
+@pytest.mark.parametrize("pooled", [True, False], ids=["pooled", "fresh"])
+def test_request_latency(benchmark, benchmark_loop, benchmark_standin, pooled):
+    """Latency of one API request, with or without the connection pool."""
+    client = ComapClient(
+        "benchmark",
+        "benchmark",
+        base_url=benchmark_standin.base_url,
+        auth_url=benchmark_standin.auth_url,
+    )
+    # Measure the connections, not the request pacing meant for the real API.
+    client._rate_limiter = TokenBucket(10**6, 10**6)
+
+    async def request():
+        await client.async_get_housings()
+        if not pooled:
+            # What every request did before the pool: open a client of its
+            # own and close it once answered.
+            await client._session.aclose()
+
+    try:
+        benchmark_loop.run_until_complete(client.async_setup())
+        session = client._session
+        benchmark.group = "request"
+        benchmark.pedantic(
+            lambda: benchmark_loop.run_until_complete(request()),
+            rounds=50,
+            warmup_rounds=5,
+        )
+        assert (client._session is session) == pooled
+    finally:
+        benchmark_loop.run_until_complete(client.close())
@@ -0,0 +1,144 @@
+"""Benchmark of the refresh and entity fan-out cycle against the stand-in.
+
+For each housing size, builds the entities of every platform the way the
+integration does, then times full refreshes where a share of the zones
+changed: the fetch (setComapValues, indexing and change tracking) and the
+entity fan-out. The API requests, entity state writes and peak memory of
+a cycle are added to the extra info of the report.
+
+Run alone with ``pytest tests/test_benchmark_refresh.py``.
+"""
+
+import random
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+
+import pytest
+
+from homeassistant.core import HomeAssistant
+
+from comap_standin import StandinOptions
+from custom_components.comapsmarthome_JH import (
+    binary_sensor,
+    climate,
+    select,
+    sensor,
+    switch,
+)
+from custom_components.comapsmarthome_JH.comap import ComapClient, TokenBucket
+from custom_components.comapsmarthome_JH.comap_functions import SNAPSHOT_ENDPOINTS
+from custom_components.comapsmarthome_JH.const import DOMAIN
+from custom_components.comapsmarthome_JH.coordinator import (
+    ComapDataUpdateCoordinator,
+)
+
+ENTRY_ID = "benchmark"
+# Share of the zones whose temperature moves before each cycle.
+CHANGED_SHARE = 0.1
+
+
+async def build_entities(hass, client, coordinator):
+    """Create the entities of every platform for one coordinator."""
+    entities = []
+
+    def add_entities(new_entities, update_before_add=False):
+        entities.extend(new_entities)
+
+    hass.data[DOMAIN] = {
+        ENTRY_ID: {
+            "client": client,
+            "coordinators": {coordinator.housing_id: coordinator},
+        }
+    }
+    entry = SimpleNamespace(entry_id=ENTRY_ID)
+    await sensor.async_setup_platform(hass, client, coordinator, add_entities)
+    await climate.async_setup_platform(hass, client, coordinator, add_entities, False)
+    for platform in (switch, select, binary_sensor):
+        await platform.async_setup_entry(hass, entry, add_entities)
+    return entities
+
+
+def change_zones(state, share, rng):
+    """Move the temperature of a share of the stand-in zones."""
+    for housing in state.housings.values():
+        zones = housing["thermal_details"]["zones"]
+        for zone in rng.sample(zones, round(len(zones) * share)):
+            zone["temperature"] = round(zone["temperature"] + rng.choice((-0.5, 0.5)), 1)
+
+
+@pytest.mark.parametrize(
+    "standin_options",
+    [
+        StandinOptions(zones=zones, latency=0, jitter=0, seed=zones)
+        for zones in (1, 10, 100, 500)
+    ],
+    ids=lambda options: "%d-zones" % options.zones,
+)
+def test_refresh_cycle(benchmark, benchmark_loop, benchmark_standin, standin_options):
+    """Fetch of a full snapshot and fan-out of its changes to the entities."""
+    state = benchmark_standin.state
+    client = ComapClient(
+        "benchmark",
+        "benchmark",
+        base_url=benchmark_standin.base_url,
+        auth_url=benchmark_standin.auth_url,
+    )
+    # Measure the integration, not the request pacing meant for the real API.
+    client._rate_limiter = TokenBucket(10**6, 10**6)
+    rng = random.Random(standin_options.zones)
+    writes = []
+
+    async def async_start(config_dir):
+        hass = HomeAssistant(config_dir)
+        await client.async_setup()
+        coordinator = ComapDataUpdateCoordinator(hass, client, client.housing)
+        coordinator.data = await coordinator._async_fetch(set(SNAPSHOT_ENDPOINTS))
+        entities = await build_entities(hass, client, coordinator)
+        for entity in entities:
+            entity.async_write_ha_state = lambda entity=entity: writes.append(entity)
+        return hass, coordinator, entities
+
+    def setup():
+        change_zones(state, CHANGED_SHARE, rng)
+        state.stats.clear()
+        writes.clear()
+
+    async def async_cycle():
+        coordinator.data = await coordinator._async_fetch(set(SNAPSHOT_ENDPOINTS))
+        for entity in entities:
+            entity._handle_coordinator_update()
+
+    def cycle():
+        benchmark_loop.run_until_complete(async_cycle())
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass, coordinator, entities = benchmark_loop.run_until_complete(
+            async_start(config_dir)
+        )
+        try:
+            benchmark.group = "refresh"
+            benchmark.pedantic(cycle, setup=setup, rounds=10, warmup_rounds=1)
+
+            # One more cycle under tracemalloc, which would skew the timings.
+            setup()
+            tracemalloc.start()
+            try:
+                cycle()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        finally:
+            benchmark_loop.run_until_complete(client.close())
+            benchmark_loop.run_until_complete(hass.async_stop(force=True))
+
+    benchmark.extra_info.update(
+        entities=len(entities),
+        requests=sum(state.stats.values()),
+        writes=len(writes),
+        peak_kib=round(peak / 1024, 1),
+    )
+    # One request per endpoint, and the entities of the zones left alone
+    # are not written.
+    assert sum(state.stats.values()) == len(SNAPSHOT_ENDPOINTS)
+    assert len(writes) < len(entities)
@@ -0,0 +1,107 @@
+"""Tests of the ComapSmartHome thermostats."""
+
+import pytest
+import voluptuous as vol
+
+from homeassistant.components.climate import (
+    ATTR_TEMPERATURE,
+    DOMAIN as CLIMATE_DOMAIN,
+    SERVICE_SET_TEMPERATURE,
+)
+from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.helpers import entity_registry as er
+
+from custom_components.comapsmarthome_JH import coordinator
+from custom_components.comapsmarthome_JH.comap import MAX_CONCURRENT_REQUESTS
+from custom_components.comapsmarthome_JH.const import (
+    ATTR_INSTRUCTIONS,
+    ATTR_MAX_PARALLEL,
+    DOMAIN,
+    SERVICE_SET_ZONES_INSTRUCTIONS,
+)
+
+from . import async_setup_accounts
+
+# Thermostat zones of the stand-in, zone 2 follows the smart temperatures.
+CONNECTED_ZONE = "housing-0-zone-0"
+SMART_ZONE = "housing-0-zone-2"
+
+
+@pytest.fixture(autouse=True)
+def no_coalesce_window(monkeypatch):
+    monkeypatch.setattr(coordinator, "REFRESH_COALESCE_WINDOW", 0)
+
+
+@pytest.fixture
+async def entry(hass, comap_api):
+    (entry,) = await async_setup_accounts(hass, "a@example.com")
+    yield entry
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+def entity_id(hass, zone_id):
+    return er.async_get(hass).async_get_entity_id(CLIMATE_DOMAIN, DOMAIN, zone_id)
+
+
+def instruction(standin, zone_id):
+    for zone in standin.state.housings["housing-0"]["thermal_details"]["zones"]:
+        if zone["id"] == zone_id:
+            return zone["set_point"]["instruction"]
+
+
+async def test_target_temperature_follows_zone_group(hass, comap_api, entry):
+    """comfort is 19.5 °C for connected zones, 19 °C for smart ones."""
+    connected = hass.states.get(entity_id(hass, CONNECTED_ZONE))
+    smart = hass.states.get(entity_id(hass, SMART_ZONE))
+    assert connected.attributes[ATTR_TEMPERATURE] == 19.5
+    assert smart.attributes[ATTR_TEMPERATURE] == 19
+
+
+async def test_set_temperature_writes_instruction_of_zone_group(
+    hass, comap_api, entry
+):
+    """A temperature named in the group of the zone is sent by name."""
+    for zone_id in (CONNECTED_ZONE, SMART_ZONE):
+        await hass.services.async_call(
+            CLIMATE_DOMAIN,
+            SERVICE_SET_TEMPERATURE,
+            {ATTR_ENTITY_ID: entity_id(hass, zone_id), ATTR_TEMPERATURE: 19},
+            blocking=True,
+        )
+    assert instruction(comap_api, SMART_ZONE) == "comfort"
+    # 19 °C has no name in the connected group, the value is sent.
+    assert instruction(comap_api, CONNECTED_ZONE) == 19
+
+
+async def test_set_zones_instructions_names_temperatures(hass, comap_api, entry):
+    """Bulk temperatures are resolved per zone like set_temperature."""
+    response = await hass.services.async_call(
+        DOMAIN,
+        SERVICE_SET_ZONES_INSTRUCTIONS,
+        {
+            ATTR_INSTRUCTIONS: {
+                CONNECTED_ZONE: 18.5,
+                entity_id(hass, SMART_ZONE): 16,
+            }
+        },
+        blocking=True,
+        return_response=True,
+    )
+    assert all(report["success"] for report in response["zones"].values())
+    assert instruction(comap_api, CONNECTED_ZONE) == "comfort_minus1"
+    assert instruction(comap_api, SMART_ZONE) == "eco"
+
+
+async def test_set_zones_instructions_caps_max_parallel(hass, comap_api, entry):
+    """More parallel writes than the client sends at once are rejected."""
+    with pytest.raises(vol.Invalid):
+        await hass.services.async_call(
+            DOMAIN,
+            SERVICE_SET_ZONES_INSTRUCTIONS,
+            {
+                ATTR_INSTRUCTIONS: {CONNECTED_ZONE: "eco"},
+                ATTR_MAX_PARALLEL: MAX_CONCURRENT_REQUESTS + 1,
+            },
+            blocking=True,
+        )
+    assert instruction(comap_api, CONNECTED_ZONE) == "comfort"
@@ -0,0 +1,56 @@
+"""Tests of the Comap API client."""
+
+import asyncio
+from time import time
+
+import pytest
+
+from comap_standin import StandinOptions
+
+
+async def test_restored_token_rejected_logs_in_again(comap_client, standin):
+    """A restored session unknown to the API falls back to a login."""
+    comap_client.restore_tokens(
+        {
+            "access_token": "revoked",
+            "refresh_token": "revoked",
+            "issued_at": time(),
+            "expires_in": 3600,
+        }
+    )
+
+    await comap_client.async_setup()
+
+    assert comap_client.housings == ["housing-0"]
+    # The refresh token was rejected, then the password was sent.
+    assert standin.state.stats["POST /cognito"] == 2
+    assert standin.state.stats["GET /api/park/housings"] == 2
+    assert comap_client.metrics.logins == 1
+
+
+async def test_revoked_token_is_refreshed_once(comap_client, standin):
+    """A revoked access token is renewed with the refresh token."""
+    await comap_client.async_setup()
+    standin.state.access_tokens.clear()
+    standin.state.stats.clear()
+
+    await comap_client.get_thermal_details()
+    await comap_client.get_thermal_details()
+
+    assert standin.state.stats["POST /cognito"] == 1
+    assert comap_client.metrics.token_refreshes == 1
+    assert comap_client.metrics.logins == 1
+
+
+@pytest.mark.parametrize(
+    "standin_options", [StandinOptions(latency=0, jitter=0, token_lifetime=240, seed=1)]
+)
+async def test_short_lived_token_is_renewed_ahead_of_expiry(comap_client, standin):
+    """Tokens living less than the renewal lead time do not renew in a loop."""
+    await comap_client.async_setup()
+    await asyncio.sleep(0.3)
+
+    assert standin.state.stats["POST /cognito"] == 1
+    # Renewed at three quarters of its lifetime.
+    delay = comap_client._renew_handle.when() - asyncio.get_running_loop().time()
+    assert 170 < delay <= 180
@@ -0,0 +1,92 @@
+"""Tests of the ComapSmartHome config flow."""
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from homeassistant import config_entries
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.const import CONF_PASSWORD, CONF_USERNAME
+from homeassistant.data_entry_flow import FlowResultType
+from homeassistant.helpers.httpx_client import get_async_client
+
+from custom_components.comapsmarthome_JH.const import (
+    CONF_STALE_LIMIT,
+    CONF_THERMAL_INTERVAL,
+    DEFAULT_INTERVALS,
+    DOMAIN,
+)
+from custom_components.comapsmarthome_JH.coordinator import all_coordinators
+
+from . import async_setup_accounts, mock_config_entry
+
+USER_INPUT = {CONF_USERNAME: "user@example.com", CONF_PASSWORD: "password"}
+
+
+async def test_user_step_releases_the_client(hass, comap_api):
+    """Checking the credentials arms no token renewal, keeps the session open."""
+    result = await hass.config_entries.flow.async_init(
+        DOMAIN, context={"source": config_entries.SOURCE_USER}
+    )
+    assert result["type"] == FlowResultType.FORM
+
+    with patch(
+        "custom_components.comapsmarthome_JH.async_setup_entry", return_value=True
+    ):
+        result = await hass.config_entries.flow.async_configure(
+            result["flow_id"], USER_INPUT
+        )
+    assert result["type"] == FlowResultType.CREATE_ENTRY
+    assert result["data"] == USER_INPUT
+    assert comap_api.state.stats["POST /cognito"] == 1
+    # The session shared by Home Assistant is not the client's to close.
+    assert not get_async_client(hass).is_closed
+
+
+async def test_reauth_updates_the_password(hass, comap_api):
+    """A password rejected at setup is asked again and the entry reloaded."""
+    comap_api.state.passwords[USER_INPUT[CONF_USERNAME]] = "new-password"
+    entry = mock_config_entry(hass)
+
+    assert not await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    assert entry.state is ConfigEntryState.SETUP_ERROR
+    (flow,) = hass.config_entries.flow.async_progress()
+    assert flow["context"]["source"] == config_entries.SOURCE_REAUTH
+    assert flow["step_id"] == "reauth_confirm"
+
+    result = await hass.config_entries.flow.async_configure(
+        flow["flow_id"], {CONF_PASSWORD: "wrong-password"}
+    )
+    assert result["type"] == FlowResultType.FORM
+    assert result["errors"] == {"base": "invalid_auth"}
+
+    result = await hass.config_entries.flow.async_configure(
+        flow["flow_id"], {CONF_PASSWORD: "new-password"}
+    )
+    await hass.async_block_till_done()
+    assert result["type"] == FlowResultType.ABORT
+    assert result["reason"] == "reauth_successful"
+    assert entry.data[CONF_PASSWORD] == "new-password"
+    assert entry.state is ConfigEntryState.LOADED
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_options_flow_sets_the_intervals(hass, comap_api):
+    """The polling intervals chosen in the options reach the coordinators."""
+    (entry,) = await async_setup_accounts(hass, USER_INPUT[CONF_USERNAME])
+
+    result = await hass.config_entries.options.async_init(entry.entry_id)
+    assert result["type"] == FlowResultType.FORM
+    assert result["step_id"] == "init"
+
+    options = dict(DEFAULT_INTERVALS, **{CONF_THERMAL_INTERVAL: 2, CONF_STALE_LIMIT: 10})
+    result = await hass.config_entries.options.async_configure(
+        result["flow_id"], options
+    )
+    await hass.async_block_till_done()
+    assert result["type"] == FlowResultType.CREATE_ENTRY
+    assert entry.options == options
+    for coordinator in all_coordinators(hass):
+        assert coordinator.update_interval == timedelta(minutes=2)
+        assert coordinator.stale_limit == 10 * 60
+    assert await hass.config_entries.async_unload(entry.entry_id)
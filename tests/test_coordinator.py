@@ -0,0 +1,228 @@
+"""Tests of the housing coordinator and its snapshot store."""
+
+import asyncio
+from datetime import timedelta
+from time import monotonic
+from unittest.mock import patch
+
+import httpx
+import pytest
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from homeassistant.util import dt as dt_util
+
+from comap_standin import StandinOptions
+from custom_components.comapsmarthome_JH import coordinator as coordinator_module
+from custom_components.comapsmarthome_JH.comap_functions import (
+    index_snapshot,
+    snapshot_payloads,
+)
+from custom_components.comapsmarthome_JH.const import DOMAIN
+from custom_components.comapsmarthome_JH.coordinator import (
+    STORAGE_SAVE_DELAY,
+    ComapDataUpdateCoordinator,
+    ComapSnapshotStore,
+)
+from custom_components.comapsmarthome_JH.profiler import (
+    LOOP_BLOCKED_THRESHOLD,
+    LOOP_LAG_INTERVAL,
+    LoopLagMonitor,
+)
+
+THERMAL = "/api/thermal/housings/{housing}"
+THERMAL_DETAILS = "GET " + THERMAL + "/thermal-details"
+THERMAL_WRITE = (
+    "POST " + THERMAL + "/thermal-control/zones/{zone}/temporary-instruction"
+)
+PROGRAMS = "GET " + THERMAL + "/programs"
+
+
+@pytest.fixture(autouse=True)
+def short_coalesce_window(monkeypatch):
+    monkeypatch.setattr(coordinator_module, "REFRESH_COALESCE_WINDOW", 0.2)
+
+
+async def test_refresh_saves_snapshot(hass, hass_storage, comap_client):
+    """A refresh with a store attached writes the snapshot to storage."""
+    await comap_client.async_setup()
+    store = ComapSnapshotStore(hass, "entry")
+    coordinator = ComapDataUpdateCoordinator(
+        hass, comap_client, "housing-0", store=store
+    )
+    store.coordinators = [coordinator]
+
+    await coordinator.async_refresh()
+    assert coordinator.last_update_success
+
+    async_fire_time_changed(
+        hass, dt_util.utcnow() + timedelta(seconds=STORAGE_SAVE_DELAY + 1)
+    )
+    await hass.async_block_till_done()
+    housings = hass_storage[DOMAIN + ".entry"]["data"]["housings"]
+    assert [housing["housing_id"] for housing in housings] == ["housing-0"]
+    zones = housings[0]["snapshot"]["thermal_details"]["zones"]
+    assert [zone["id"] for zone in zones] == list(coordinator.data["zones_by_id"])
+
+
+async def test_snapshot_keeps_only_the_models(hass, standin, comap_client):
+    """The payloads rebuilt from the models parse back into the same snapshot."""
+    await comap_client.async_setup()
+    coordinator = ComapDataUpdateCoordinator(hass, comap_client, "housing-0")
+    await coordinator.async_refresh()
+
+    payloads = snapshot_payloads(coordinator.data)
+    assert not set(payloads) & set(coordinator.data)
+    assert index_snapshot(payloads) == coordinator.data
+    thermal_details = standin.state.housings["housing-0"]["thermal_details"]
+    assert payloads["thermal_details"]["zones"] == thermal_details["zones"]
+
+
+@pytest.mark.parametrize(
+    "standin_options", [StandinOptions(latency=0.1, jitter=0, seed=1)]
+)
+async def test_patch_during_fetch_is_kept(hass, standin, comap_client):
+    """A write patched in while a fetch is in flight survives the fetch."""
+    await comap_client.async_setup()
+    coordinator = ComapDataUpdateCoordinator(hass, comap_client, "housing-0")
+    await coordinator.async_refresh()
+    zone_id = "housing-0-zone-1"
+    zone = coordinator.data["zones_by_id"][zone_id].as_dict()
+
+    # Only the programs are refetched, the zones are carried over.
+    coordinator.invalidate("programs")
+    refresh = hass.async_create_task(coordinator.async_refresh())
+    await asyncio.sleep(0.05)
+    assert standin.state.in_flight == 1
+    response = dict(zone, set_point={"instruction": "frost_protection"})
+    await coordinator.async_apply_zone_response(zone_id, response)
+    await refresh
+
+    assert coordinator.last_update_success
+    assert coordinator.data["zones_by_id"][zone_id].instruction == "frost_protection"
+
+
+async def test_concurrent_writes_share_one_fetch(hass, standin, comap_client):
+    """Refreshes requested by concurrent writes are merged into one fetch."""
+    await comap_client.async_setup()
+    coordinator = ComapDataUpdateCoordinator(hass, comap_client, "housing-0")
+    await coordinator.async_refresh()
+    zone_ids = list(coordinator.data["zones_by_id"])
+    stats_url = standin.base_url.removesuffix("api/") + "_standin/stats"
+    async with httpx.AsyncClient() as session:
+        await session.delete(stats_url)
+
+        async def write(zone_id):
+            await comap_client.set_temporary_instruction(zone_id, "eco")
+            await coordinator.async_refresh_endpoints("thermal_details")
+
+        await asyncio.gather(
+            *(write(zone_id) for zone_id in zone_ids),
+            coordinator.async_refresh_endpoints("programs"),
+        )
+        stats = (await session.get(stats_url)).json()
+
+    assert stats[THERMAL_WRITE] == len(zone_ids)
+    assert stats[THERMAL_DETAILS] == 1
+    assert stats[PROGRAMS] == 1
+    assert all(
+        zone.temporary_instruction is not None
+        for zone in coordinator.data["zones_by_id"].values()
+    )
+
+
+async def test_lone_refresh_starts_at_once(hass, standin, comap_client, monkeypatch):
+    """A request alone does not wait for the merge window to end."""
+    monkeypatch.setattr(coordinator_module, "REFRESH_COALESCE_WINDOW", 30)
+    await comap_client.async_setup()
+    coordinator = ComapDataUpdateCoordinator(hass, comap_client, "housing-0")
+    await coordinator.async_refresh()
+
+    async with asyncio.timeout(5):
+        await coordinator.async_refresh_endpoints("thermal_details")
+    assert standin.state.stats[THERMAL_DETAILS] == 2
+    await coordinator.async_shutdown()
+
+
+async def test_shutdown_cancels_the_trailing_refresh(hass, standin, comap_client):
+    """A merged refresh still waiting for its window never starts."""
+    await comap_client.async_setup()
+    coordinator = ComapDataUpdateCoordinator(hass, comap_client, "housing-0")
+    await coordinator.async_refresh_endpoints("thermal_details")
+    trailing = hass.async_create_task(
+        coordinator.async_refresh_endpoints("thermal_details")
+    )
+    await asyncio.sleep(0)
+
+    await coordinator.async_shutdown()
+    with pytest.raises(asyncio.CancelledError):
+        await trailing
+    await asyncio.sleep(0.3)
+    assert standin.state.stats[THERMAL_DETAILS] == 1
+
+
+async def test_failed_coalesced_refresh_releases_waiters(
+    hass, standin, comap_client
+):
+    """Every waiter returns when the merged fetch falls back to a full refresh."""
+    await comap_client.async_setup()
+    coordinator = ComapDataUpdateCoordinator(hass, comap_client, "housing-0")
+    await coordinator.async_refresh()
+    standin.state.options.error_rate = 1
+
+    async with asyncio.timeout(5):
+        await asyncio.gather(
+            *(coordinator.async_refresh_endpoints("thermal_details") for _ in range(5))
+        )
+
+    # The full refresh failed as well and kept serving the last snapshot.
+    assert coordinator.last_error is not None
+    assert coordinator.last_update_success
+    await coordinator.async_shutdown()
+
+
+async def test_failed_fallback_refresh_releases_waiters(
+    hass, standin, comap_client
+):
+    """Every waiter gets the error when the fallback refresh cannot start."""
+    await comap_client.async_setup()
+    coordinator = ComapDataUpdateCoordinator(hass, comap_client, "housing-0")
+    await coordinator.async_refresh()
+    standin.state.options.error_rate = 1
+
+    with patch.object(
+        coordinator, "async_request_refresh", side_effect=RuntimeError("boom")
+    ):
+        async with asyncio.timeout(5):
+            results = await asyncio.gather(
+                *(
+                    coordinator.async_refresh_endpoints("thermal_details")
+                    for _ in range(5)
+                ),
+                return_exceptions=True,
+            )
+
+    assert [str(result) for result in results] == ["boom"] * 5
+
+
+@pytest.mark.parametrize(
+    "standin_options", [StandinOptions(latency=0.3, jitter=0, seed=1)]
+)
+async def test_loop_stays_responsive_during_login_and_refresh(hass, comap_client):
+    """Slow API answers are awaited without ever blocking the event loop."""
+    monitor = LoopLagMonitor()
+    monitor.start()
+    start = monotonic()
+    await comap_client.async_setup()
+    coordinator = ComapDataUpdateCoordinator(hass, comap_client, "housing-0")
+    await coordinator.async_refresh()
+    elapsed = monotonic() - start
+    await monitor.stop()
+
+    assert coordinator.last_update_success
+    # A login, the housings and the concurrent endpoint fetches each wait
+    # for the latency at least once.
+    assert elapsed >= 0.9
+    lag = monitor.as_dict()
+    assert lag["blocked"] == 0
+    assert lag["max_lag"] < LOOP_BLOCKED_THRESHOLD
+    assert lag["samples"] >= elapsed / LOOP_LAG_INTERVAL / 2
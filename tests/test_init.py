@@ -0,0 +1,178 @@
+"""Tests of the setup and unload of a ComapSmartHome entry."""
+
+import asyncio
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from pytest_homeassistant_custom_component.common import async_fire_time_changed
+
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.util import dt as dt_util
+
+from comap_standin import StandinOptions
+import custom_components.comapsmarthome_JH as integration
+from custom_components.comapsmarthome_JH import comap
+from custom_components.comapsmarthome_JH.comap_functions import SNAPSHOT_ENDPOINTS
+from custom_components.comapsmarthome_JH.const import DOMAIN
+from custom_components.comapsmarthome_JH.coordinator import (
+    STORAGE_SAVE_DELAY,
+    all_coordinators,
+)
+
+from . import async_setup_accounts, mock_config_entry
+
+
+@pytest.mark.parametrize(
+    "standin_options", [StandinOptions(latency=0, jitter=0, error_rate=1, seed=1)]
+)
+async def test_failed_setup_closes_client(hass, comap_api):
+    """A setup failing after the login is retried, no token renewal armed."""
+    entry = mock_config_entry(hass)
+
+    assert not await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    assert entry.state is ConfigEntryState.SETUP_RETRY
+    assert comap_api.state.stats["POST /cognito"] == 1
+    # A renewal timer left behind would fail the test at teardown.
+
+
+async def test_unload_and_reload_close_the_pool(hass, comap_api):
+    """Every client built by a setup closes its connection pool on unload."""
+    (entry,) = await async_setup_accounts(hass, "a@example.com")
+    first = hass.data[DOMAIN][entry.entry_id]["client"]._session
+    assert not first.is_closed
+
+    assert await hass.config_entries.async_reload(entry.entry_id)
+    await hass.async_block_till_done()
+    second = hass.data[DOMAIN][entry.entry_id]["client"]._session
+    assert first.is_closed
+    assert second is not first and not second.is_closed
+
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    assert second.is_closed
+
+
+@pytest.mark.parametrize(
+    "standin_options",
+    [StandinOptions(latency=0, jitter=0, auth_error_rate=1, seed=1)],
+)
+async def test_login_outage_retries_setup(hass, comap_api):
+    """A Cognito outage at the first setup is retried, not taken as bad credentials."""
+    entry = mock_config_entry(hass)
+
+    assert not await hass.config_entries.async_setup(entry.entry_id)
+    await hass.async_block_till_done()
+    assert entry.state is ConfigEntryState.SETUP_RETRY
+    assert not hass.config_entries.flow.async_progress()
+
+
+@pytest.mark.parametrize(
+    "standin_options", [StandinOptions(housings=2, latency=0.02, jitter=0, seed=1)]
+)
+async def test_entries_keep_separate_data(hass, comap_api, monkeypatch):
+    """Entries of two accounts share the request cap, not their data."""
+    monkeypatch.setattr(integration, "MAX_SHARED_CONCURRENT_REQUESTS", 3)
+    # Only the concurrency caps should hold the requests back.
+    monkeypatch.setattr(comap, "RATE_LIMIT_BURST", 100)
+    usernames = ("a@example.com", "b@example.com")
+    entries = await async_setup_accounts(hass, *usernames)
+
+    clients = set()
+    for username, entry in zip(usernames, entries):
+        entry_data = hass.data[DOMAIN][entry.entry_id]
+        clients.add(entry_data["client"])
+        coordinators = entry_data["coordinators"]
+        assert list(coordinators) == comap_api.state.accounts[username]
+        for housing_id, coordinator in coordinators.items():
+            assert coordinator.data["housing_info"].id == housing_id
+            assert all(
+                zone_id.startswith(housing_id + "-")
+                for zone_id in coordinator.data["zones_by_id"]
+            )
+    assert len(clients) == 2
+
+    # Every housing of both accounts refetches all of its endpoints at once,
+    # 2 clients allowing 4 requests each are held to the shared cap of 3.
+    comap_api.state.max_in_flight = 0
+    coordinators = list(all_coordinators(hass))
+    for coordinator in coordinators:
+        coordinator.invalidate(*SNAPSHOT_ENDPOINTS)
+    await asyncio.gather(*(coordinator.async_refresh() for coordinator in coordinators))
+    assert all(coordinator.last_update_success for coordinator in coordinators)
+    assert comap_api.state.max_in_flight == 3
+
+    for entry in entries:
+        assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_restart_restores_snapshot_and_session(hass, hass_storage, comap_api):
+    """A second start builds the entities from storage before any API call."""
+    (entry,) = await async_setup_accounts(hass, "a@example.com")
+    # Flush the delayed writes of the snapshot and of the tokens.
+    async_fire_time_changed(
+        hass, dt_util.utcnow() + timedelta(seconds=STORAGE_SAVE_DELAY + 1)
+    )
+    await hass.async_block_till_done()
+    assert DOMAIN + "." + entry.entry_id in hass_storage
+    assert DOMAIN + ".auth." + entry.entry_id in hass_storage
+    cold_states = {
+        state.entity_id: state.state for state in hass.states.async_all()
+    }
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+    requests = []
+    original_setup_entry = integration.async_setup_entry
+
+    async def setup_entry(hass, entry):
+        result = await original_setup_entry(hass, entry)
+        # Counted before the background refresh gets a chance to run.
+        requests.append(sum(comap_api.state.stats.values()))
+        return result
+
+    comap_api.state.stats.clear()
+    with patch.object(integration, "async_setup_entry", setup_entry):
+        assert await hass.config_entries.async_setup(entry.entry_id)
+    assert requests == [0]
+    await hass.async_block_till_done()
+
+    assert entry.state is ConfigEntryState.LOADED
+    for coordinator in all_coordinators(hass):
+        await coordinator.async_refresh()
+        assert coordinator.last_update_success
+    # The restored session was used, the password was not sent again.
+    assert comap_api.state.stats["POST /cognito"] == 0
+    assert comap_api.state.stats["GET /api/park/housings"] >= 1
+    warm_states = {
+        state.entity_id: state.state for state in hass.states.async_all()
+    }
+    assert warm_states.keys() == cold_states.keys()
+    assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_restart_picks_up_changed_housings(hass, hass_storage, comap_api):
+    """A housing added to the account since the cache was saved gets set up."""
+    (entry,) = await async_setup_accounts(hass, "a@example.com")
+    async_fire_time_changed(
+        hass, dt_util.utcnow() + timedelta(seconds=STORAGE_SAVE_DELAY + 1)
+    )
+    await hass.async_block_till_done()
+    assert await hass.config_entries.async_unload(entry.entry_id)
+    await hass.async_block_till_done()
+
+    housing_id = comap_api.state.add_housing("a@example.com")
+    assert await hass.config_entries.async_setup(entry.entry_id)
+    # The entry is reloaded once the refresh of the cached entry found it.
+    async with asyncio.timeout(5):
+        while housing_id not in hass.data[DOMAIN].get(entry.entry_id, {}).get(
+            "coordinators", {}
+        ):
+            await hass.async_block_till_done()
+            await asyncio.sleep(0.01)
+
+    assert entry.state is ConfigEntryState.LOADED
+    coordinators = hass.data[DOMAIN][entry.entry_id]["coordinators"]
+    assert list(coordinators) == comap_api.state.accounts["a@example.com"]
+    assert all(coordinator.last_update_success for coordinator in coordinators.values())
+    assert await hass.config_entries.async_unload(entry.entry_id)
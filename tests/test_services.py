@@ -0,0 +1,84 @@
+"""Tests of the ComapSmartHome services."""
+
+import pytest
+import voluptuous as vol
+
+from homeassistant.const import ATTR_DEVICE_ID
+from homeassistant.exceptions import ServiceValidationError
+from homeassistant.helpers import device_registry as dr
+
+from custom_components.comapsmarthome_JH import coordinator
+from custom_components.comapsmarthome_JH.const import (
+    ATTR_CONFIG_ENTRY_ID,
+    DOMAIN,
+    SERVICE_SET_AWAY,
+    SERVICE_SET_HOME,
+)
+
+from . import async_setup_accounts
+
+
+@pytest.fixture(autouse=True)
+def no_coalesce_window(monkeypatch):
+    monkeypatch.setattr(coordinator, "REFRESH_COALESCE_WINDOW", 0)
+
+
+def away(standin, housing_id):
+    events = standin.state.housings[housing_id]["thermal_details"]["events"]
+    return "time_shift" in events
+
+
+async def test_set_away_and_home_act_on_their_target(hass, comap_api):
+    """Only the targeted housings are set away or brought back home."""
+    usernames = ("a@example.com", "b@example.com")
+    entry_a, entry_b = await async_setup_accounts(hass, *usernames)
+    housing_a, housing_b = (
+        comap_api.state.accounts[username][0] for username in usernames
+    )
+    device_b = dr.async_get(hass).async_get_device(identifiers={(DOMAIN, housing_b)})
+
+    await hass.services.async_call(
+        DOMAIN, SERVICE_SET_AWAY, {ATTR_DEVICE_ID: device_b.id}, blocking=True
+    )
+    assert not away(comap_api, housing_a)
+    assert away(comap_api, housing_b)
+
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_SET_AWAY,
+        {ATTR_CONFIG_ENTRY_ID: entry_a.entry_id},
+        blocking=True,
+    )
+    assert away(comap_api, housing_a)
+
+    await hass.services.async_call(
+        DOMAIN,
+        SERVICE_SET_HOME,
+        {ATTR_CONFIG_ENTRY_ID: entry_b.entry_id},
+        blocking=True,
+    )
+    assert away(comap_api, housing_a)
+    assert not away(comap_api, housing_b)
+    # The refresh following the write reached the housing of entry b only.
+    data_b = hass.data[DOMAIN][entry_b.entry_id]["coordinators"][housing_b].data
+    assert data_b["housing_info"].time_shift is None
+
+    for entry in (entry_a, entry_b):
+        assert await hass.config_entries.async_unload(entry.entry_id)
+
+
+async def test_set_away_needs_a_target(hass, comap_api):
+    """Calls without a target or with an unknown one are rejected."""
+    (entry,) = await async_setup_accounts(hass, "a@example.com")
+
+    with pytest.raises(vol.Invalid):
+        await hass.services.async_call(DOMAIN, SERVICE_SET_AWAY, {}, blocking=True)
+    with pytest.raises(ServiceValidationError):
+        await hass.services.async_call(
+            DOMAIN, SERVICE_SET_AWAY, {ATTR_CONFIG_ENTRY_ID: "unknown"}, blocking=True
+        )
+    assert not any(
+        away(comap_api, housing_id) for housing_id in comap_api.state.housings
+    )
+
+    assert await hass.config_entries.async_unload(entry.entry_id)